@@ -0,0 +1,82 @@
+import re
+import sys
+import json
+import time
+import argparse
+
+import lambda_function
+
+# Compare prompt encodings by size and, with --invoke, by per-model latency.
+#
+#   python benchmark_prompt.py                      # sizes only, live candles
+#   python benchmark_prompt.py --candles data.json  # sizes for saved candles
+#   python benchmark_prompt.py --invoke --runs 3    # also call every model
+#
+# --candles takes the "ActualData" string/object returned by the lambda.
+
+encodings = ["json"] + list(lambda_function.prompt_encoders)
+
+
+def approx_tokens(text):
+    # Rough BPE estimate: digit runs split every 3 digits, words, whitespace
+    # runs and punctuation are one token each
+    return len(re.findall(r"\d{1,3}|[A-Za-z]+|\s+|[^\w\s]", text))
+
+
+def load_candles(path):
+    if not path:
+        return lambda_function.get_crypto_data()
+    with open(path) as f:
+        data = json.load(f)
+    # Keep the same shape get_crypto_data returns
+    return data if isinstance(data, str) else json.dumps(data, indent=2)
+
+
+def time_model(foundation_models, model_name, prompt, runs):
+    matching_model = foundation_models["byName"].get(model_name)
+    if not matching_model:
+        return 0.0, "Model : " + model_name + " not found"
+    latencies = []
+    answer = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            # Straight to Bedrock: get_model's prediction memo would answer
+            # every run after the first
+            answer = lambda_function.call_bedrock(prompt, matching_model)
+        except Exception as e:
+            answer = "error: " + str(e)
+        latencies.append(time.perf_counter() - start)
+    return sum(latencies) / len(latencies), answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt encodings")
+    parser.add_argument("--candles", help="JSON file with saved ActualData")
+    parser.add_argument("--invoke", action="store_true", help="call every model per encoding")
+    parser.add_argument("--runs", type=int, default=1, help="calls per model and encoding")
+    args = parser.parse_args()
+
+    actualData = load_candles(args.candles)
+    prompts = {encoding: lambda_function.parse_prompt(actualData, encoding) for encoding in encodings}
+
+    baseline = approx_tokens(prompts["json"])
+    print(f"{'encoding':<14}{'chars':>8}{'~tokens':>10}{'vs json':>9}")
+    for encoding, prompt in prompts.items():
+        tokens = approx_tokens(prompt)
+        print(f"{encoding:<14}{len(prompt):>8}{tokens:>10}{tokens / baseline:>9.0%}")
+
+    if not args.invoke:
+        return
+
+    foundation_models = lambda_function.get_model_catalog()
+    print()
+    print(f"{'encoding':<14}{'model':<26}{'latency s':>10}  answer")
+    for encoding, prompt in prompts.items():
+        for model_name in lambda_function.model_names:
+            latency, answer = time_model(foundation_models, model_name, prompt, args.runs)
+            print(f"{encoding:<14}{model_name:<26}{latency:>10.3f}  {str(answer).strip()!r}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
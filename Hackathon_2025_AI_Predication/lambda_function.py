@@ -1,7 +1,18 @@
+import os
+import re
 import json
+import hashlib
 import boto3
 import requests
 import datetime
+import threading
+import time
+import numpy as np
+from decimal import Decimal
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Bedrock and Bedrock Runtime clients
 bedrock = boto3.client("bedrock", region_name="us-east-1")
@@ -9,13 +20,90 @@ bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-east-1")
 predictionCandleTimestamp = None
 previousClose = None
 
+# Models raced every round (keys of the "Answers" map)
+model_names = [
+    "Jamba 1.5 Mini",
+    "Nova Lite",
+    "Command Light",
+    # "Llama 3 8B Instruct",
+    # "Mistral 7B Instruct",
+    # # "SDXL 1.0",
+    # "Titan Text G1 - Express",
+    # # "Claude Instant",
+]
+
+# Run every model's Bedrock call in parallel instead of one after another
+fan_out_predictions = True
+# Read answers with invoke_model_with_response_stream and stop at the first number
+streaming_predictions = os.environ.get("STREAMING_PREDICTIONS", "false") == "true"
+# Seconds each model gets before it is dropped from the round's answers
+model_deadline_seconds = 8
+
+# Answer the round with the in-process baseline predictors as well
+local_predictors_enabled = True
+ema_span = 10
+vwap_reversion = 0.5
+
+# Kept at module level so warm invocations reuse the worker threads
+prediction_executor = ThreadPoolExecutor(max_workers=16)
+
+# Foundation model catalog, shared by warm invocations of this container
+model_catalog_ttl_seconds = 6 * 3600
+model_catalog = None
+model_catalog_lock = threading.Lock()
+model_catalog_refreshing = False
+
+# Prediction memo, keyed by modelId + candle window, so duplicate scheduler
+# fires for the same candle don't pay for Bedrock again
+prediction_cache_size = 256
+prediction_cache_ttl_seconds = 15 * 60
+prediction_cache = OrderedDict()
+prediction_cache_lock = threading.Lock()
+# Optional shared tier (partition key "cacheKey", TTL attribute "expiresAt")
+prediction_cache_table_name = os.environ.get("PREDICTION_CACHE_TABLE")
+prediction_cache_table = (
+    boto3.resource("dynamodb", region_name="us-east-1").Table(prediction_cache_table_name)
+    if prediction_cache_table_name else None
+)
+
+# Binance klines; point BINANCE_KLINES_URL at a local stub for tests
+binance_klines_url = os.environ.get("BINANCE_KLINES_URL", "https://api.binance.com/api/v3/klines")
+kline_symbol = "DOGEUSDT"
+kline_interval_minutes = 5
+kline_window = 20
+
+# Candle encoding used in the prompt: "json" (original), "compact_json", "csv"
+# or "columnar"; compare them with benchmark_prompt.py
+prompt_encoding = os.environ.get("PROMPT_ENCODING", "json")
+prompt_price_decimals = 5
+prompt_volume_decimals = 0
+
+# (open time ms, candle dict) for the last kline_window candles, oldest first
+candle_cache = deque(maxlen=kline_window)
+
+
+def build_http_session():
+    # Pooled keep-alive session with retries on throttling and 5xx
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"]
+    )
+    session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+    return session
+
+http_session = build_http_session()
+
 
 def lambda_handler(event, context):
     global predictionCandleTimestamp , previousClose
     try:
         
-        # Get model list
-        foundation_models = bedrock.list_foundation_models(byInferenceType="ON_DEMAND")
+        # Get model list (cached across warm invocations)
+        foundation_models = get_model_catalog()
         # model_names = [model["modelName"] for model in foundation_models["modelSummaries"]]
         # model_names = [
         #     model["modelName"]
@@ -26,6 +114,7 @@ def lambda_handler(event, context):
         # return
         actualData = get_crypto_data()
         prompt = parse_prompt(actualData)
+        window_key = candle_window_key()
 
         if prompt is None:
             return {
@@ -33,14 +122,16 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Missing 'input.question' in request"})
             }
         
-        answer1 = get_model(foundation_models,"Jamba 1.5 Mini",prompt)
-        answer2 = get_model(foundation_models,"Nova Lite",prompt)
-        answer3 = get_model(foundation_models,"Command Light",prompt)
-        # answer4 = get_model(foundation_models,"Llama 3 8B Instruct",prompt)
-        # answer5 = get_model(foundation_models,"Mistral 7B Instruct",prompt)
-        # # answer6 = get_model(foundation_models,"SDXL 1.0",prompt)
-        # answer7 = get_model(foundation_models, "Titan Text G1 - Express", prompt)
-        # # answer8 = get_model(foundation_models, "Claude Instant", prompt)
+        if fan_out_predictions:
+            answers = get_models_concurrently(foundation_models, model_names, prompt, window_key)
+        else:
+            answers = {
+                model_name: get_model(foundation_models, model_name, prompt, window_key)
+                for model_name in model_names
+            }
+
+        if local_predictors_enabled:
+            answers.update(run_local_predictors([candle for _, candle in candle_cache]))
 
         return {
             "statusCode": 200,
@@ -54,14 +145,8 @@ def lambda_handler(event, context):
                 "PreviousClose": previousClose,
                 "PredictionCandleTimestamp": predictionCandleTimestamp.isoformat() + "Z",
                 "Answers": {
-                    "Jamba 1.5 Mini": answer1.strip(),
-                    "Nova Lite": answer2.strip(),
-                    "Command Light": answer3.strip(),
-                    # "Llama 3 8B Instruct": answer4.strip(),
-                    # "Mistral 7B Instruct": answer5.strip(),
-                    # # "SDXL 1.0": answer6.strip()
-                    # "Titan Text G1 - Express": answer7.strip()
-                    # # "Claude Instant": answer8.strip()
+                    model_name: answer.strip()
+                    for model_name, answer in answers.items()
                 }
             })
         }
@@ -73,14 +158,14 @@ def lambda_handler(event, context):
         }
 
 def call_bedrock(prompt,matching_model):
-    # Construct payload
+    # Construct payload (already serialized by the provider adapter)
     payload = build_payload(matching_model["modelId"], prompt)
     # Call Bedrock
     
     modelId = sanitize_model_id(matching_model)
     
     response = bedrock_runtime.invoke_model(
-        body=json.dumps(payload),
+        body=payload,
         modelId=modelId,
         accept="application/json",
         contentType="application/json")
@@ -93,28 +178,263 @@ def call_bedrock(prompt,matching_model):
 
     return answer
 
-def parse_prompt(body_json):
-    # Parse prompt    
+# A number counts as complete once something other than more digits follows it
+complete_number = re.compile(r"-?\d+(?:\.\d+)?(?=[^\d.]|\.[^\d])")
+any_number = re.compile(r"-?\d+(?:\.\d+)?")
+
+def call_bedrock_streaming(prompt, matching_model):
+    payload = build_payload(matching_model["modelId"], prompt)
+    modelId = sanitize_model_id(matching_model)
+    adapter = resolve_adapter(modelId)
+
+    response = bedrock_runtime.invoke_model_with_response_stream(
+        body=payload,
+        modelId=modelId,
+        accept="application/json",
+        contentType="application/json")
+
+    stream = response.get("body")
+    text = ""
+    try:
+        for event in stream:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            text += adapter["extract_chunk"](json.loads(chunk["bytes"])) or ""
+            match = complete_number.search(text)
+            if match:
+                # Got the close price; drop the rest of the generation
+                return Decimal(match.group())
+    finally:
+        stream.close()
+
+    # Stream ended right after the number (or never produced one)
+    match = any_number.search(text)
+    if not match:
+        raise Exception(f"No numeric answer from {modelId}: {text!r}")
+    return Decimal(match.group())
+
+def candle_window_key():
+    # Identifies the prediction candle, not the prompt text: the last cached
+    # candle is still forming, so its prices differ between duplicate fires
+    if not candle_cache:
+        return None
+    window = [kline_symbol, kline_interval_minutes, prompt_encoding, candle_cache[0][0], candle_cache[-1][0]]
+    return hashlib.sha256(json.dumps(window).encode()).hexdigest()
+
+def cached_call_bedrock(prompt, matching_model, window_key=None):
+    cache_key = matching_model["modelId"] + "#" + (window_key or hashlib.sha256(prompt.encode()).hexdigest())
+    now = time.time()
+
+    with prediction_cache_lock:
+        entry = prediction_cache.get(cache_key)
+        if entry and entry[1] > now:
+            prediction_cache.move_to_end(cache_key)
+            return entry[0]
+
+    answer = None
+    if prediction_cache_table is not None:
+        try:
+            item = prediction_cache_table.get_item(Key={"cacheKey": cache_key}).get("Item")
+            # DynamoDB TTL deletes lazily, so check expiry ourselves
+            if item and item.get("expiresAt", 0) > now:
+                answer = item["answer"]
+        except Exception as e:
+            print("Prediction cache read failed : ", e)
+
+    if answer is None:
+        if streaming_predictions:
+            answer = str(call_bedrock_streaming(prompt, matching_model))
+        else:
+            answer = call_bedrock(prompt, matching_model)
+        if prediction_cache_table is not None:
+            try:
+                prediction_cache_table.put_item(Item={
+                    "cacheKey": cache_key,
+                    "modelId": matching_model["modelId"],
+                    "answer": answer,
+                    "expiresAt": int(now + prediction_cache_ttl_seconds)
+                })
+            except Exception as e:
+                print("Prediction cache write failed : ", e)
+
+    with prediction_cache_lock:
+        prediction_cache[cache_key] = (answer, now + prediction_cache_ttl_seconds)
+        prediction_cache.move_to_end(cache_key)
+        while len(prediction_cache) > prediction_cache_size:
+            prediction_cache.popitem(last=False)
+
+    return answer
+
+def parse_prompt(body_json, encoding=None):
+    # "json" is the original double-encoded prompt; see prompt_encoders
+    encoding = encoding or prompt_encoding
+    if encoding == "json":
+        prompt = (
+        "Given the following candlestick data (timestamp, open, high, low, close, volume) for the last 10 candles:\n"
+        + json.dumps(body_json, indent=2)
+        + "\nPredict the next candle's *closing price*. "
+        + "Respond with only a single number, no words, no symbols, no explanation."
+        )
+        # print("INPUT PROMPT : ", prompt) 
+        return prompt
+
+    if encoding not in prompt_encoders:
+        raise Exception(f"Unsupported prompt encoding: {encoding}")
+
+    candles = json.loads(body_json)["candles"] if isinstance(body_json, str) else body_json["candles"]
     prompt = (
-    "Given the following candlestick data (timestamp, open, high, low, close, volume) for the last 10 candles:\n"
-    + json.dumps(body_json, indent=2)
-    + "\nPredict the next candle's *closing price*. "
-    + "Respond with only a single number, no words, no symbols, no explanation."
+        prompt_encoders[encoding](candles)
+        + "\nPredict the next candle's closing price. "
+        + "Respond with only a single number, no words, no symbols, no explanation."
     )
-    # print("INPUT PROMPT : ", prompt) 
     return prompt
 
-def get_model(foundation_models,modelName,prompt):
-    # Look for the Jamba 1.5 Mini model
-    matching_model = next(
-        (model for model in foundation_models["modelSummaries"] 
-            if model.get("modelName") == modelName), None
+def format_price(value):
+    return f"{float(value):.{prompt_price_decimals}f}"
+
+def format_volume(value):
+    return f"{float(value):.{prompt_volume_decimals}f}"
+
+def encode_compact_json(candles):
+    # Same rows as "json" but one array per candle, numbers unquoted
+    rows = [
+        '["%s",%s,%s,%s,%s,%s]' % (
+            candle["timestamp"],
+            format_price(candle["open"]), format_price(candle["high"]),
+            format_price(candle["low"]), format_price(candle["close"]),
+            format_volume(candle["volume"])
+        )
+        for candle in candles
+    ]
+    return (
+        f"{kline_symbol} {kline_interval_minutes}m candles, oldest first, "
+        "as [timestamp,open,high,low,close,volume]:\n"
+        "[" + ",".join(rows) + "]"
+    )
+
+def encode_csv(candles):
+    # Timestamps become minute offsets from the first candle
+    base = datetime.datetime.strptime(candles[0]["timestamp"].rstrip("Z"), "%Y-%m-%dT%H:%M:%S")
+    rows = [
+        "%d,%s,%s,%s,%s,%s" % (
+            (datetime.datetime.strptime(candle["timestamp"].rstrip("Z"), "%Y-%m-%dT%H:%M:%S") - base).total_seconds() // 60,
+            format_price(candle["open"]), format_price(candle["high"]),
+            format_price(candle["low"]), format_price(candle["close"]),
+            format_volume(candle["volume"])
+        )
+        for candle in candles
+    ]
+    return (
+        f"{kline_symbol} {kline_interval_minutes}m candles, oldest first, "
+        f"t = minutes after {candles[0]['timestamp']}:\n"
+        "t,open,high,low,close,volume\n"
+        + "\n".join(rows)
     )
 
+def encode_columnar(candles):
+    # One array per field; timestamps implied by start + step
+    columns = {
+        "start": candles[0]["timestamp"],
+        "stepMinutes": kline_interval_minutes,
+        "open": [format_price(candle["open"]) for candle in candles],
+        "high": [format_price(candle["high"]) for candle in candles],
+        "low": [format_price(candle["low"]) for candle in candles],
+        "close": [format_price(candle["close"]) for candle in candles],
+        "volume": [format_volume(candle["volume"]) for candle in candles]
+    }
+    # Numbers go in unquoted
+    body = json.dumps(columns, separators=(",", ":")).replace('"', "")
+    return f"{kline_symbol} {kline_interval_minutes}m candles, oldest first, as columns:\n" + body
+
+prompt_encoders = {
+    "compact_json": encode_compact_json,
+    "csv": encode_csv,
+    "columnar": encode_columnar
+}
+
+def load_model_catalog():
+    response = bedrock.list_foundation_models(byInferenceType="ON_DEMAND")
+    summaries = response["modelSummaries"]
+    return {
+        "modelSummaries": summaries,
+        # First listing wins, matching the old next(...) scan
+        "byName": {
+            model["modelName"]: model
+            for model in reversed(summaries) if model.get("modelName")
+        },
+        "byId": {model["modelId"]: model for model in summaries},
+        "loadedAt": time.monotonic()
+    }
+
+def refresh_model_catalog():
+    global model_catalog, model_catalog_refreshing
+    try:
+        catalog = load_model_catalog()
+        with model_catalog_lock:
+            model_catalog = catalog
+    except Exception as e:
+        # Keep serving the stale copy; the next invocation retries
+        print("Model catalog refresh failed : ", e)
+    finally:
+        with model_catalog_lock:
+            model_catalog_refreshing = False
+
+def get_model_catalog():
+    global model_catalog, model_catalog_refreshing
+    with model_catalog_lock:
+        catalog = model_catalog
+        refresh = (
+            catalog is not None
+            and not model_catalog_refreshing
+            and time.monotonic() - catalog["loadedAt"] > model_catalog_ttl_seconds
+        )
+        if refresh:
+            model_catalog_refreshing = True
+
+    if catalog is None:
+        # Cold start: nothing to fall back to, so load inline
+        catalog = load_model_catalog()
+        with model_catalog_lock:
+            model_catalog = catalog
+    elif refresh:
+        # Serve the stale copy now, swap in the new listing when it lands
+        threading.Thread(target=refresh_model_catalog, daemon=True).start()
+
+    return catalog
+
+def get_model(foundation_models,modelName,prompt,window_key=None):
+    matching_model = foundation_models["byName"].get(modelName)
+
     if not matching_model:
         return "Model : " + modelName + " not found"
 
-    return call_bedrock(prompt,matching_model)
+    return cached_call_bedrock(prompt,matching_model,window_key)
+
+def get_models_concurrently(foundation_models, modelNames, prompt, window_key=None):
+    # Fan out one Bedrock call per model; round wall time is the slowest model
+    futures = {
+        prediction_executor.submit(get_model, foundation_models, modelName, prompt, window_key): modelName
+        for modelName in modelNames
+    }
+
+    # All calls start together, so one shared deadline is a per-model deadline
+    done, not_done = wait(futures, timeout=model_deadline_seconds)
+
+    answers = {}
+    for future in done:
+        modelName = futures[future]
+        try:
+            answers[modelName] = future.result()
+        except Exception as e:
+            print("Model : " + modelName + " failed : ", e)
+
+    for future in not_done:
+        # Leave the call running in the pool; its answer is simply dropped
+        print("Model : " + futures[future] + " missed the deadline")
+
+    # Keep the configured ordering for the response
+    return {modelName: answers[modelName] for modelName in modelNames if modelName in answers}
 
 def sanitize_model_id(matching_model):
     # if matching_model["providerName"] == "Amazon":
@@ -123,117 +443,238 @@ def sanitize_model_id(matching_model):
     # print("model ID : ", matching_model["modelId"])
     return matching_model["modelId"]
 
+# Placeholder swapped for the JSON-encoded prompt in each request template
+PROMPT = "__PROMPT__"
+
+default_generation_params = {"max_tokens": 10, "temperature": 0.7}
+
+# modelId prefix -> adapter, and modelId -> resolved adapter (memoized)
+provider_adapters = {}
+resolved_adapters = {}
+
+def register_provider(prefix, build_template, extract_text, extract_chunk, **generation_params):
+    # build_template receives the adapter's generation params and returns the
+    # request body with PROMPT where the prompt goes. It is rendered to JSON
+    # once here, so each call is a string join instead of a dict build + dumps.
+    # extract_chunk pulls the text delta out of one response stream chunk.
+    params = {**default_generation_params, **generation_params}
+    template = json.dumps(build_template(params))
+    head, tail = template.split(json.dumps(PROMPT))
+    provider_adapters[prefix] = {
+        "prefix": prefix,
+        "params": params,
+        "head": head,
+        "tail": tail,
+        "extract_text": extract_text,
+        "extract_chunk": extract_chunk
+    }
+    resolved_adapters.clear()
+
+def resolve_adapter(model_id):
+    adapter = resolved_adapters.get(model_id)
+    if adapter is None:
+        # Longest prefix wins so e.g. "amazon.nova" beats a generic "amazon."
+        matches = [prefix for prefix in provider_adapters if model_id.startswith(prefix)]
+        if not matches:
+            raise Exception(f"Unsupported model type for: {model_id}")
+        adapter = provider_adapters[max(matches, key=len)]
+        resolved_adapters[model_id] = adapter
+    return adapter
+
 def build_payload(model_id, prompt):
-    max_tokens = 10
-    temperature = 0.7
-    
-    if model_id.startswith("anthropic."):
-        return {
-            "prompt": prompt,
-            "max_tokens_to_sample": max_tokens,
-            "temperature": temperature,
-            "top_p": 1
-        }
-    elif model_id.startswith("ai21."):
-        return {
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
-    elif model_id.startswith("amazon.nova"):
-        inf_params = {"maxTokens": max_tokens, "topP": 1, "topK": 1, "temperature": temperature}
-        return {
-            "inferenceConfig": inf_params,
-            "messages": [
-                { "role": "user",
-                "content": [
-                    {
-                    "text": prompt
-                    }
-                ]
-                }
-            ]
-        }
-    elif model_id.startswith("amazon.titan"):
-        return {
-            "inputText": prompt,
-            "textGenerationConfig": {
-                "temperature": temperature,  
-                "topP": 1,
-                "maxTokenCount": max_tokens
-            }
-        }
-    elif model_id.startswith("meta."):
-        return {
-            "prompt": prompt,
-            "temperature": temperature,
-            "max_gen_len": max_tokens
-        }
-    elif model_id.startswith("mistral."):
-        return {
-            "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-    elif model_id.startswith("cohere."):
-        return {
-            "prompt": prompt,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-    else:
-        raise Exception(f"Unsupported model input type for: {model_id}")
+    # Returns the serialized request body for invoke_model
+    adapter = resolve_adapter(model_id)
+    return adapter["head"] + json.dumps(prompt) + adapter["tail"]
 
 def build_response(model_id,payload):
-    
-    if model_id.startswith("anthropic."):
-        return ""
-    elif model_id.startswith("ai21."):
-        return payload["choices"][0]["message"]["content"]
-    elif model_id.startswith("amazon.nova"):
-        return payload["output"]["message"]["content"][0]["text"]
-    elif model_id.startswith("amazon.titan"):
-        return payload["results"][0]["outputText"]
-    elif model_id.startswith("meta."):
-        return payload["generation"]
-    elif model_id.startswith("mistral."):
-        return payload["outputs"][0]["text"]
-    elif model_id.startswith("cohere."):
-        return payload["generations"][0]["text"]
-    else:
-        raise Exception(f"Unsupported model output type for: {model_id}")
+    return resolve_adapter(model_id)["extract_text"](payload)
 
-def get_crypto_data():
-    global predictionCandleTimestamp, previousClose
-    interval = 5
-    url = "https://api.binance.com/api/v3/klines"
-    params = {
-        "symbol": "DOGEUSDT",
-        "interval": str(interval) + "m",
-        "limit": 20
+register_provider(
+    "anthropic.",
+    lambda params: {
+        "prompt": PROMPT,
+        "max_tokens_to_sample": params["max_tokens"],
+        "temperature": params["temperature"],
+        "top_p": 1
+    },
+    lambda payload: "",
+    lambda chunk: chunk.get("completion", "")
+)
+register_provider(
+    "ai21.",
+    lambda params: {
+        "messages": [{"role": "user", "content": PROMPT}],
+        "max_tokens": params["max_tokens"],
+        "temperature": params["temperature"]
+    },
+    lambda payload: payload["choices"][0]["message"]["content"],
+    lambda chunk: (chunk.get("choices") or [{}])[0].get("delta", {}).get("content", "")
+)
+register_provider(
+    "amazon.nova",
+    lambda params: {
+        "inferenceConfig": {
+            "maxTokens": params["max_tokens"],
+            "topP": 1,
+            "topK": 1,
+            "temperature": params["temperature"]
+        },
+        "messages": [{"role": "user", "content": [{"text": PROMPT}]}]
+    },
+    lambda payload: payload["output"]["message"]["content"][0]["text"],
+    lambda chunk: chunk.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+)
+register_provider(
+    "amazon.titan",
+    lambda params: {
+        "inputText": PROMPT,
+        "textGenerationConfig": {
+            "temperature": params["temperature"],
+            "topP": 1,
+            "maxTokenCount": params["max_tokens"]
+        }
+    },
+    lambda payload: payload["results"][0]["outputText"],
+    lambda chunk: chunk.get("outputText", "")
+)
+register_provider(
+    "meta.",
+    lambda params: {
+        "prompt": PROMPT,
+        "temperature": params["temperature"],
+        "max_gen_len": params["max_tokens"]
+    },
+    lambda payload: payload["generation"],
+    lambda chunk: chunk.get("generation", "")
+)
+register_provider(
+    "mistral.",
+    lambda params: {
+        "prompt": PROMPT,
+        "temperature": params["temperature"],
+        "max_tokens": params["max_tokens"]
+    },
+    lambda payload: payload["outputs"][0]["text"],
+    lambda chunk: (chunk.get("outputs") or [{}])[0].get("text", "")
+)
+register_provider(
+    "cohere.",
+    lambda params: {
+        "prompt": PROMPT,
+        "temperature": params["temperature"],
+        "max_tokens": params["max_tokens"]
+    },
+    lambda payload: payload["generations"][0]["text"],
+    lambda chunk: chunk.get("text", "")
+)
+
+def candle_arrays(candles):
+    # One float64 row per field so every predictor is a vector op
+    values = np.array(
+        [[candle["high"], candle["low"], candle["close"], candle["volume"]] for candle in candles],
+        dtype=np.float64
+    )
+    return {"high": values[:, 0], "low": values[:, 1], "close": values[:, 2], "volume": values[:, 3]}
+
+def predict_last_close(arrays):
+    return arrays["close"][-1]
+
+def predict_ema(arrays):
+    close = arrays["close"]
+    alpha = 2 / (ema_span + 1)
+    # Newest candle gets weight 1, older ones decay by (1 - alpha)
+    weights = (1 - alpha) ** np.arange(len(close) - 1, -1, -1)
+    return np.dot(weights, close) / weights.sum()
+
+def predict_linear_drift(arrays):
+    close = arrays["close"]
+    x = np.arange(len(close))
+    slope, intercept = np.polyfit(x, close, 1)
+    return slope * len(close) + intercept
+
+def predict_vwap(arrays):
+    close = arrays["close"]
+    volume = arrays["volume"]
+    typical = (arrays["high"] + arrays["low"] + close) / 3
+    if volume.sum() == 0:
+        return close[-1]
+    vwap = np.dot(typical, volume) / volume.sum()
+    # Pull the last close part of the way back towards VWAP
+    return close[-1] + vwap_reversion * (vwap - close[-1])
+
+# Answers map name -> predictor, run on the same window as the Bedrock prompt
+local_predictors = {
+    "Baseline Last Close": predict_last_close,
+    "Baseline EMA": predict_ema,
+    "Baseline Linear Drift": predict_linear_drift,
+    "Baseline VWAP": predict_vwap
+}
+
+def run_local_predictors(candles):
+    if not candles:
+        return {}
+    arrays = candle_arrays(candles)
+    answers = {}
+    for name, predictor in local_predictors.items():
+        # Same 8 decimals Binance uses, so the Assessor parses them like any answer
+        answers[name] = f"{float(predictor(arrays)):.8f}"
+    return answers
+
+def fetch_klines(params):
+    # Single seam for the Binance call so tests can swap in a stub
+    response = http_session.get(binance_klines_url, params=params, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+def parse_kline(candle):
+    open_time_ms = candle[0]
+    dt = datetime.datetime.utcfromtimestamp(open_time_ms / 1000)
+    return {
+        "timestamp": dt.isoformat() + "Z",  # ISO 8601 in UTC
+        "open": candle[1],
+        "high": candle[2],
+        "low": candle[3],
+        "close": candle[4],
+        "volume": candle[5],
     }
 
-    response = requests.get(url, params=params)
-    data = response.json()
+def refresh_candle_cache():
+    interval_ms = kline_interval_minutes * 60 * 1000
+    params = {
+        "symbol": kline_symbol,
+        "interval": str(kline_interval_minutes) + "m",
+        "limit": kline_window
+    }
 
-    candles = []
+    if candle_cache:
+        last_open_time = candle_cache[-1][0]
+        missing = (int(time.time() * 1000) - last_open_time) // interval_ms
+        if missing < kline_window:
+            # Only the newest candles; the last cached one is re-fetched
+            # because it was still forming when we cached it
+            params["startTime"] = last_open_time
+        else:
+            # Container slept through the whole window, start over
+            candle_cache.clear()
 
+    data = fetch_klines(params)
     data.sort(key=lambda candle: candle[0])
 
-
     for candle in data:
         open_time_ms = candle[0]
-        dt = datetime.datetime.utcfromtimestamp(open_time_ms / 1000)
-        candle_dict = {
-            "timestamp": dt.isoformat() + "Z",  # ISO 8601 in UTC
-            "open": candle[1],
-            "high": candle[2],
-            "low": candle[3],
-            "close": candle[4],
-            "volume": candle[5],
-        }
-        candles.append(candle_dict)
-    
+        if candle_cache and open_time_ms < candle_cache[-1][0]:
+            continue
+        if candle_cache and open_time_ms == candle_cache[-1][0]:
+            candle_cache.pop()
+        candle_cache.append((open_time_ms, parse_kline(candle)))
+
+def get_crypto_data():
+    global predictionCandleTimestamp, previousClose
+    interval = kline_interval_minutes
+
+    refresh_candle_cache()
+
+    candles = [candle for _, candle in candle_cache]
 
     # Get last candle's timestamp string
     last_timestamp_str = candles[-1]["timestamp"]  
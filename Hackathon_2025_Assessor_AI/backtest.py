@@ -0,0 +1,333 @@
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import datetime
+
+import numpy as np
+
+# The lambda builds boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import lambda_function
+import local_tables
+
+# Offline backtest of the Assessor's round pipeline over historical candles.
+#
+#   python backtest.py --candles DOGEUSDT-5m-2024.csv
+#   python backtest.py --fetch-days 30 --replay session_results.json
+#   python backtest.py --candles klines.csv --exact --max-rounds 2000
+#
+# --candles takes Binance kline CSV/JSON rows (open time ms, open, high, low,
+# close, volume, ...). The default mode scores every round in one vectorized
+# pass with the Assessor's threshold and calculate_payout; --exact instead
+# pushes each round through get_model_win_rates, build_objects_to_store,
+# store_prediction and update_actual_value against in-memory tables.
+
+window_size = 20
+interval_minutes = 5
+# Round r's prediction candle forms during tick r + 1 and is settled at tick
+# r + 2, after that tick's round has read the win rates
+settlement_lag = 3
+# Outcomes in each model's recent-stats ring
+accuracy_lookback = 10
+
+
+def load_candles(path):
+    rows = []
+    with open(path) as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = [row for row in csv.reader(f) if row and row[0].isdigit()]
+    rows.sort(key=lambda row: int(row[0]))
+    return to_arrays(rows)
+
+
+def fetch_candles(days, symbol='DOGEUSDT'):
+    import requests
+
+    session = requests.Session()
+    interval_ms = interval_minutes * 60 * 1000
+    end = int(time.time() * 1000) // interval_ms * interval_ms
+    start = end - days * 24 * 60 * 60 * 1000
+    rows = []
+    while start < end:
+        response = session.get('https://api.binance.com/api/v3/klines', params={
+            'symbol': symbol,
+            'interval': f'{interval_minutes}m',
+            'startTime': start,
+            'limit': 1000
+        }, timeout=10)
+        response.raise_for_status()
+        page = response.json()
+        if not page:
+            break
+        rows.extend(page)
+        start = page[-1][0] + interval_ms
+    # The newest candle is still forming
+    return to_arrays([row for row in rows if row[0] < end])
+
+
+def to_arrays(rows):
+    values = np.array([[float(value) for value in row[1:6]] for row in rows], dtype=np.float64)
+    open_time = np.array([int(row[0]) for row in rows], dtype=np.int64)
+    # Binance historical dumps switched to microseconds in 2025
+    open_time = np.where(open_time > 10**14, open_time // 1000, open_time)
+    return {
+        'openTime': open_time,
+        'open': values[:, 0],
+        'high': values[:, 1],
+        'low': values[:, 2],
+        'close': values[:, 3],
+        'volume': values[:, 4]
+    }
+
+
+def timestamp(open_time_ms):
+    # Same format AI_Predication writes for candleTimestamp
+    return datetime.datetime.utcfromtimestamp(open_time_ms / 1000).isoformat() + 'Z'
+
+
+def windows(candles):
+    # [round, candle in window] views; round r ends at candle r + window_size - 1
+    # and predicts candle r + window_size
+    view = np.lib.stride_tricks.sliding_window_view
+    return {field: view(candles[field][:-1], window_size) for field in ('high', 'low', 'close', 'volume')}
+
+
+# Predictors take the windows dict and return one prediction per round (NaN
+# where they have nothing to say). Same baselines as AI_Predication.
+
+def predict_last_close(window):
+    return window['close'][:, -1]
+
+
+def predict_ema(window, span=10):
+    alpha = 2 / (span + 1)
+    weights = (1 - alpha) ** np.arange(window_size - 1, -1, -1)
+    return window['close'] @ weights / weights.sum()
+
+
+def predict_linear_drift(window):
+    x = np.arange(window_size, dtype=np.float64)
+    x_mean = x.mean()
+    close = window['close']
+    slope = ((x - x_mean) * (close - close.mean(axis=1, keepdims=True))).sum(axis=1) / ((x - x_mean) ** 2).sum()
+    intercept = close.mean(axis=1) - slope * x_mean
+    return slope * window_size + intercept
+
+
+def predict_vwap(window, reversion=0.5):
+    close = window['close']
+    volume = window['volume']
+    typical = (window['high'] + window['low'] + close) / 3
+    total = volume.sum(axis=1)
+    vwap = np.divide((typical * volume).sum(axis=1), total, out=close[:, -1].copy(), where=total > 0)
+    return close[:, -1] + reversion * (vwap - close[:, -1])
+
+
+predictors = {
+    'Baseline Last Close': predict_last_close,
+    'Baseline EMA': predict_ema,
+    'Baseline Linear Drift': predict_linear_drift,
+    'Baseline VWAP': predict_vwap
+}
+
+
+def load_replay(path=None):
+    # Stored predictions from Session_Results: a JSON export (list of items)
+    # or, without a path, a scan of the live table
+    if path:
+        with open(path) as f:
+            items = json.load(f)
+    else:
+        items = []
+        kwargs = {}
+        while True:
+            response = lambda_function.sessionResultsTable.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    replayed = {}
+    for item in items:
+        try:
+            prediction = float(str(item['prediction']).strip('.'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        replayed.setdefault(item['modelName'], {})[item['candleTimestamp']] = prediction
+    return replayed
+
+
+def replay_predictor(by_timestamp, target_timestamps):
+    def predict(window):
+        return np.array([by_timestamp.get(ts, np.nan) for ts in target_timestamps], dtype=np.float64)
+    return predict
+
+
+def payout_lookup():
+    # calculate_payout only ever sees k / n win rates, so run the real
+    # function once per possible value instead of once per round
+    table = np.zeros((accuracy_lookback + 1, accuracy_lookback + 1))
+    for n in range(accuracy_lookback + 1):
+        for k in range(n + 1):
+            table[n, k] = float(lambda_function.calculate_payout(k / n if n else 0))
+    return table
+
+
+def score_batched(predictions, previous_close, actual_close):
+    # One pass over every round and model with the Assessor's scoring engine
+    scores = lambda_function.score_predictions(predictions, previous_close, actual_close)
+    settled = scores['valid']
+    win = scores['win']
+
+    # Win rate the Assessor would have seen when opening round r: the model
+    # stats ring holds the last accuracy_lookback settled outcomes, and the
+    # newest settlement_lag - 1 rounds are not settled yet
+    wins = np.cumsum(np.pad(win, ((0, 0), (1, 0))), axis=1)
+    counts = np.cumsum(np.pad(settled, ((0, 0), (1, 0))), axis=1)
+    rounds = predictions.shape[1]
+    newest = np.clip(np.arange(rounds) - settlement_lag + 1, 0, None)
+    oldest = np.clip(newest - accuracy_lookback, 0, None)
+    recent_wins = wins[:, newest] - wins[:, oldest]
+    recent_counts = counts[:, newest] - counts[:, oldest]
+    payout_ratio = payout_lookup()[recent_counts, recent_wins]
+
+    # One unit bet on the model every round it answered
+    profit = np.where(win, payout_ratio - 1, np.where(settled, -1.0, 0.0))
+    return {
+        **scores,
+        'settled': settled,
+        'payoutRatio': payout_ratio,
+        'profit': profit
+    }
+
+
+def run_exact(model_names, predictions, candles, target_timestamps):
+    # Push every round through the lambda's pipeline stages and tables
+    resource = local_tables.install(lambda_function, local_tables.assessor_tables())
+    table = resource.Table('Bolt_Hackathon_2025_Session_Results')
+    rounds = predictions.shape[1]
+
+    for r in range(rounds):
+        answers = {
+            model_name: f'{predictions[m, r]:.8f}'
+            for m, model_name in enumerate(model_names)
+            if not np.isnan(predictions[m, r])
+        }
+        # The tick's window ends with the previous round's target candle, which
+        # is still forming live, so the settle stage leaves it for next tick
+        actual = [
+            {'timestamp': timestamp(candles['openTime'][i]), 'close': f'{candles["close"][i]:.8f}'}
+            for i in range(r, r + window_size)
+        ]
+        lambda_function.lambda_handler({
+            'stage': 'persist',
+            'answers': answers,
+            'predictionCandleTimestamp': target_timestamps[r],
+            'previousClose': f'{candles["close"][r + window_size - 1]:.8f}',
+            'candles': actual
+        }, None)
+        lambda_function.pipeline_queue.drain(lambda_function.lambda_handler)
+
+    win = np.zeros(predictions.shape, dtype=bool)
+    settled = np.zeros(predictions.shape, dtype=bool)
+    payout_ratio = np.zeros(predictions.shape)
+    direction_hit = np.zeros(predictions.shape, dtype=bool)
+    direction_valid = np.zeros(predictions.shape, dtype=bool)
+    absolute_percent_error = np.full(predictions.shape, np.nan)
+    brier_score = np.full(predictions.shape, np.nan)
+    for m, model_name in enumerate(model_names):
+        for r in range(rounds):
+            item = table.get_item(Key={'candleTimestamp': target_timestamps[r], 'modelName': model_name}).get('Item')
+            if not item or item.get('accuracy') is None:
+                continue
+            settled[m, r] = True
+            win[m, r] = item['sessionStatus'] == 'WIN'
+            payout_ratio[m, r] = float(item['payoutRatio'])
+            if item.get('directionHit') is not None:
+                direction_valid[m, r] = True
+                direction_hit[m, r] = item['directionHit']
+                brier_score[m, r] = float(item['brierScore'])
+            if item.get('absolutePercentError') is not None:
+                absolute_percent_error[m, r] = float(item['absolutePercentError'])
+    profit = np.where(win, payout_ratio - 1, np.where(settled, -1.0, 0.0))
+    return {
+        'valid': settled, 'win': win, 'settled': settled, 'payoutRatio': payout_ratio, 'profit': profit,
+        'directionHit': direction_hit, 'directionValid': direction_valid,
+        'absolutePercentError': absolute_percent_error, 'brierScore': brier_score
+    }
+
+
+def report(model_names, results, rounds, elapsed, curve_path=None):
+    print(f'{rounds} rounds x {len(model_names)} models in {elapsed:.2f}s '
+          f'({rounds / elapsed:,.0f} rounds/sec)')
+    print()
+    print(f"{'model':<26}{'bets':>8}{'win rate':>10}{'dir hit':>9}{'MAPE %':>9}{'Brier':>8}{'P&L':>10}{'max DD':>10}")
+    summary = lambda_function.summarize_scores(results, axis=1)
+    curves = np.cumsum(results['profit'], axis=1)
+    for m, model_name in enumerate(model_names):
+        curve = curves[m]
+        drawdown = (np.maximum.accumulate(curve) - curve).max()
+        print(f"{model_name:<26}{summary['settled'][m]:>8}{summary['winRate'][m]:>10.1%}"
+              f"{summary['directionHitRate'][m]:>9.1%}{summary['mape'][m]:>9.3f}{summary['brier'][m]:>8.3f}"
+              f"{curve[-1]:>10.2f}{drawdown:>10.2f}")
+
+    if curve_path:
+        with open(curve_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['round'] + model_names)
+            for r in range(rounds):
+                writer.writerow([r] + [f'{curves[m, r]:.4f}' for m in range(len(model_names))])
+        print(f'\nPayout curves written to {curve_path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest the Assessor pipeline')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--candles', help='Binance kline CSV or JSON file')
+    source.add_argument('--fetch-days', type=int, help='download this many days of 5m klines')
+    parser.add_argument('--replay', nargs='?', const='', help='replay stored predictions (JSON export, or the live table if no path)')
+    parser.add_argument('--no-baselines', action='store_true', help='only score replayed predictions')
+    parser.add_argument('--exact', action='store_true', help='run each round through the lambda functions')
+    parser.add_argument('--max-rounds', type=int, help='only use the most recent N rounds')
+    parser.add_argument('--curve-out', help='write cumulative P&L per round to this CSV')
+    args = parser.parse_args()
+
+    candles = load_candles(args.candles) if args.candles else fetch_candles(args.fetch_days)
+    if args.max_rounds:
+        keep = args.max_rounds + window_size
+        candles = {field: values[-keep:] for field, values in candles.items()}
+    if len(candles['close']) <= window_size:
+        raise SystemExit('Not enough candles for a single round')
+
+    window = windows(candles)
+    target_timestamps = [timestamp(t) for t in candles['openTime'][window_size:]]
+    actual_close = candles['close'][window_size:]
+    previous_close = candles['close'][window_size - 1:-1]
+
+    active = {} if args.no_baselines else dict(predictors)
+    if args.replay is not None:
+        for model_name, by_timestamp in load_replay(args.replay or None).items():
+            active[model_name] = replay_predictor(by_timestamp, target_timestamps)
+    if not active:
+        raise SystemExit('No predictors selected')
+
+    model_names = list(active)
+    start = time.perf_counter()
+    predictions = np.vstack([active[name](window) for name in model_names])
+    if args.exact:
+        results = run_exact(model_names, predictions, candles, target_timestamps)
+    else:
+        results = score_batched(predictions, previous_close, actual_close)
+    elapsed = time.perf_counter() - start
+
+    report(model_names, results, predictions.shape[1], elapsed, args.curve_out)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
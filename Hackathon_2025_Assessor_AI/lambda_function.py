@@ -1,8 +1,15 @@
+import os
 import boto3
 import json
 from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
-from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.types import TypeSerializer
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import random
+import time
 import uuid
 
 lambda_client = boto3.client('lambda') 
@@ -11,140 +18,883 @@ sessionResultsTable = dynamodb.Table('Bolt_Hackathon_2025_Session_Results')
 sessionsTable = dynamodb.Table('Bolt_Hackathon_2025_Sessions')
 userTable = dynamodb.Table('Bolt_Hackathon_2025_Users')
 userBidsTable = dynamodb.Table('Bolt_Hackathon_2025_User_Bids')
+# One item per model: lifetime counters plus a ring of recent outcomes
+modelStatsTable = dynamodb.Table('Bolt_Hackathon_2025_Model_Stats')
+# One item per round being settled: winning models, page cursors, status
+settlementCheckpointTable = dynamodb.Table('Bolt_Hackathon_2025_Settlement_Checkpoints')
+# Shared wallet balance cache read by the Users lambda; payouts drop the
+# entries of every address they sent to
+balance_cache_table_name = os.environ.get('BALANCE_CACHE_TABLE')
+balanceCacheTable = dynamodb.Table(balance_cache_table_name) if balance_cache_table_name else None
 
 payout_threshold = Decimal('0.998')
 
+# transact_write_items only exists on the low-level client
+serializer = TypeSerializer()
+
+# Slope of the logistic that turns a predicted move into an "up" probability
+# for the Brier score: a predicted 0.1% move reads as ~73% up
+brier_scale = 1000
+
+# Recent outcomes kept per model (recent0 .. recent9), same window the
+# old getAverageAccuracy query looked at
+model_stats_ring_size = 10
+
+# Bid settlement writes run on a bounded pool and back off when throttled
+settlement_write_concurrency = 32
+settlement_chunk_size = 500
+throttling_error_codes = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded'
+}
+transaction_retry_codes = {'ThrottlingError', 'ProvisionedThroughputExceeded', 'TransactionConflict'}
+settlement_executor = ThreadPoolExecutor(max_workers=settlement_write_concurrency)
+
+# Payouts go out as Algorand atomic groups (max 16 transfers each), several
+# groups in flight at once
+payout_group_size = 16
+payout_concurrency = 8
+payout_executor = ThreadPoolExecutor(max_workers=payout_concurrency)
+
+# Must match the Bid lambda's BID_SHARD_COUNT: with N > 0 a round's bids are
+# spread over roundShard-userId-index partitions "<roundId>#0" .. "#N-1" and
+# each bid page is gathered from all of them in parallel
+bid_shard_count = int(os.environ.get('BID_SHARD_COUNT', '0'))
+bid_shard_executor = ThreadPoolExecutor(max_workers=16)
+
+# Stop starting new bid pages when less than this much Lambda time is left
+# and hand the rest of the round to a fresh invocation: a quarter of the
+# configured timeout, at most 60s
+settlement_time_reserve_ms = 60 * 1000
+settlement_time_reserve_fraction = 0.25
+
+# Per invocation: the reserve in use, and how many bid pages were processed.
+# The first page always is, so every invocation makes progress.
+time_reserve_ms = settlement_time_reserve_ms
+pages_processed = 0
+
+# Round ids are derived from the predicted candle's timestamp, so a retried
+# persist stage writes the same round instead of a second one
+round_id_namespace = uuid.uuid5(uuid.NAMESPACE_URL, 'bolt-hackathon-2025/rounds')
+
+# Where stages hand off to the next one; None means async self-invocation
+pipeline_queue = None
+
+# Same flag as the Bid lambda: only escrow-mode deployments (which have
+# escrowState-index on Users) run the collect stage and credit the ledger
+escrow_mode = os.environ.get('BID_ESCROW_MODE', 'false') == 'true'
+# Algorand minimum account balance plus one transaction fee, held back from
+# the ledger so a collection can always be paid (same as the Bid lambda)
+escrow_reserve = Decimal('0.1') + Decimal('0.001')
+
  
 def lambda_handler(event, context):
 
+    start_invocation(context)
+
+    # Scheduled runs carry no stage and start a new round
+    stage = event.get('stage', 'predict')
+    if stage not in pipeline_stages:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({"error": f"Unknown stage: {stage}"})
+        }
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(pipeline_stages[stage](event, context), default=str)
+    }
+
+
+def run_predict_stage(event, context):
     mock = False
-    round_id = str(uuid.uuid4())
 
     if mock:
          answers, prediction_candle_timestamp, previous_close_price, actualData = generateMockData()
     else:
         answers, prediction_candle_timestamp, previous_close_price, actualData = invoke_prediction_lambda()
 
+    # The answers travel in the message, so a failed persist retries without
+    # asking the models again
+    enqueue_stage('persist', {
+        'answers': answers,
+        'predictionCandleTimestamp': prediction_candle_timestamp,
+        'previousClose': previous_close_price,
+        'candles': actualData["candles"]
+    }, context)
+
+    return {"message": "Predicted round", "predictionCandleTimestamp": prediction_candle_timestamp}
+
+
+def run_persist_stage(event, context):
+    prediction_candle_timestamp = event['predictionCandleTimestamp']
+    previous_close_price = event['previousClose']
+    answers = event['answers']
+    round_id = round_id_for(prediction_candle_timestamp)
+
     objects_to_store = []
 
-    uniqueModals = []
+    # One read for every model's recent win rate
+    win_rates = get_model_win_rates(list(answers))
 
     # Format output nicely
     for model, prediction in answers.items():
-        average_accuracy = getAverageAccuracy(model)
+        average_accuracy = win_rates[model]
 
         payout_ratio = calculate_payout(average_accuracy)
 
         objects_to_store.append(build_objects_to_store(model, prediction.strip('.'), prediction_candle_timestamp,previous_close_price,payout_ratio,round_id))
-        uniqueModals.append(model)
 
-    storeSessionObject(prediction_candle_timestamp,uniqueModals,round_id)
+    storeSessionObject(prediction_candle_timestamp,list(answers),round_id)
 
-    uniqueModals = set(uniqueModals)
     store_prediction(objects_to_store)
 
-    winners = update_actual_value(actualData["candles"], uniqueModals)
+    # The round is open for bids; settling older rounds and collecting the
+    # escrowed stakes of the round that just closed happen off this path
+    enqueue_stage('settle', {'candles': event.get('candles') or []}, context)
+    if escrow_mode:
+        enqueue_stage('collect', {}, context)
+
+    return {"message": "Stored round", "roundId": round_id, "savedData": objects_to_store}
+
+
+def run_settle_stage(event, context):
+    candles = event.get('candles') or []
+    winners = update_actual_value(candles)
+
+    # Rounds settled in this run, plus the round of every closed candle, so
+    # a retry after the predictions were marked settled still finds its rounds
+    round_timestamps = {round_id_for(candle['timestamp']): candle['timestamp'] for candle in closed_candles(candles)}
+    for winner in winners:
+        round_timestamps.setdefault(winner['roundId'], winner['candleTimestamp'])
+    round_ids = list(dict.fromkeys(list(round_timestamps) + event.get('roundIds', [])))
+    checkpoints = get_checkpoints(round_ids)
+
+    unfinished = []
+    to_pay = []
+    for round_id in round_ids:
+        checkpoint = checkpoints.get(round_id)
+        if checkpoint is None:
+            # Winners always come from the stored rows: after a partial
+            # settle, this run may only have settled the losing models
+            if round_id not in round_timestamps:
+                continue
+            winning_models = settled_winning_models(round_id, round_timestamps[round_id])
+            if winning_models is None:
+                continue
+            checkpoint = start_checkpoint(round_id, winning_models)
+
+        if checkpoint['settlementStatus'] == 'IN_PROGRESS':
+            if not settle_round(checkpoint, context):
+                unfinished.append(round_id)
+                continue
+            checkpoint['settlementStatus'] = 'SETTLED'
+        if checkpoint['settlementStatus'] == 'SETTLED':
+            to_pay.append(round_id)
+
+    if unfinished:
+        enqueue_stage('settle', {'roundIds': unfinished}, context)
+    if to_pay:
+        enqueue_stage('payout', {'roundIds': to_pay}, context)
+
+    return {"message": "Settled rounds", "roundIds": to_pay, "unfinished": unfinished}
+
+
+def run_payout_stage(event, context):
+    round_ids = event.get('roundIds', [])
+    checkpoints = get_checkpoints(round_ids)
+
+    unfinished = []
+    for round_id in round_ids:
+        checkpoint = checkpoints.get(round_id)
+        # Only rounds whose bids are all settled; DONE rounds are already paid
+        if not checkpoint or checkpoint['settlementStatus'] != 'SETTLED':
+            continue
+        if not pay_round(checkpoint, context):
+            unfinished.append(round_id)
+
+    if unfinished:
+        enqueue_stage('payout', {'roundIds': unfinished}, context)
+
+    return {"message": "Paid rounds", "unfinished": unfinished}
+
 
-    update_user_bids_table(winners)
+def run_collect_stage(event, context):
+    # Moves escrow-mode stakes on chain: every user with uncollected bid
+    # debits pays them to the house, up to 16 users per atomic group
+    keys = query_all(
+        userTable,
+        IndexName='escrowState-index',
+        KeyConditionExpression=Key('escrowState').eq('PENDING')
+    )
+    users = batch_get_all(userTable.name, [{'UserId': key['UserId']} for key in keys]) if keys else []
+
+    # Nothing owed (e.g. a bid was rolled back): just leave the index
+    write_concurrently(userTable.update_item, [clear_escrow_state(user) for user in users if not user.get('escrowPending')])
+    owing = [user for user in users if user.get('escrowPending')]
+
+    # Claim PENDING -> COLLECTING for exactly the amount read; a bid landing
+    # in between fails the claim and waits for the next round
+    claimed = [
+        user for user, was_claimed in zip(owing, write_concurrently(userTable.update_item, [
+            {
+                'Key': {'UserId': user['UserId']},
+                'UpdateExpression': 'SET escrowState = :collecting, escrowCollecting = :amount',
+                'ConditionExpression': 'escrowState = :pending AND escrowPending = :amount',
+                'ExpressionAttributeValues': {
+                    ':collecting': 'COLLECTING', ':pending': 'PENDING', ':amount': user['escrowPending']
+                }
+            }
+            for user in owing
+        ]))
+        if was_claimed
+    ]
+
+    groups = [claimed[i:i + payout_group_size] for i in range(0, len(claimed), payout_group_size)]
+    futures = [payout_executor.submit(send_collect_group, group) for group in groups]
+    unsent = []
+    failed = []
+    for future in futures:
+        group_unsent, group_failed = future.result()
+        unsent.extend(group_unsent)
+        failed.extend(group_failed)
+    unsent_ids = {user['UserId'] for user in unsent}
+    failed_ids = {user['UserId'] for user in failed}
+    collected = [user for user in claimed if user['UserId'] not in unsent_ids and user['UserId'] not in failed_ids]
+
+    # Never reached the chain: back to PENDING, collected with the next round
+    write_concurrently(userTable.update_item, [
+        {
+            'Key': {'UserId': user['UserId']},
+            'UpdateExpression': 'SET escrowState = :pending REMOVE escrowCollecting',
+            'ExpressionAttributeValues': {':pending': 'PENDING'}
+        }
+        for user in unsent
+    ])
+
+    # Like payouts, a failed group may or may not have landed, so its amount
+    # is parked in escrowFailed for a manual look instead of being collected
+    # again; the user's later debits keep being collected as usual
+    write_concurrently(userTable.update_item, [
+        {
+            'Key': {'UserId': user['UserId']},
+            'UpdateExpression': 'SET escrowState = :pending, escrowFailed = if_not_exists(escrowFailed, :zero) + escrowCollecting '
+                                'REMOVE escrowCollecting ADD escrowPending :uncollected',
+            'ExpressionAttributeValues': {':pending': 'PENDING', ':zero': 0, ':uncollected': -user['escrowPending']}
+        }
+        for user in failed
+    ])
+    write_concurrently(userTable.update_item, [clear_escrow_state(user) for user in failed])
 
+    if collected:
+        record_collections(collected)
+
+    return {"message": "Collected escrow", "collected": len(collected), "unsent": len(unsent), "failed": len(failed)}
+
+
+def record_collections(collected):
+    try:
+        balances = get_chain_balances([user['key'] for user in collected])
+    except Exception as e:
+        print("Balance lookup after collection failed : ", e)
+        balances = {}
+
+    updates = []
+    for user in collected:
+        values = {
+            ':uncollected': -user['escrowPending'],
+            ':pending': 'PENDING',
+            ':now': datetime.utcnow().isoformat()
+        }
+        expression = 'SET escrowState = :pending, escrowSyncedAt = :now REMOVE escrowCollecting ADD escrowPending :uncollected'
+        balance = balances.get(user['key'])
+        if balance is not None:
+            # Resync the ledger with the chain (fees, deposits): operands read
+            # the old escrowPending, which still includes what was collected.
+            # The account minimum and the next collection's fee can't be bid.
+            values[':available'] = Decimal(str(balance)) + user['escrowPending'] - escrow_reserve
+            expression = 'SET escrowBalance = :available - escrowPending, escrowState = :pending, escrowSyncedAt = :now ' \
+                         'REMOVE escrowCollecting ADD escrowPending :uncollected'
+        updates.append({
+            'Key': {'UserId': user['UserId']},
+            'UpdateExpression': expression,
+            'ExpressionAttributeValues': values
+        })
+    write_concurrently(userTable.update_item, updates)
+
+    # Users who bid again meanwhile stay PENDING for the next round
+    write_concurrently(userTable.update_item, [clear_escrow_state(user) for user in collected])
+    invalidate_balance_cache([user['key'] for user in collected])
+
+
+def clear_escrow_state(user):
     return {
-        'statusCode': 200,
-        'body': json.dumps({
-            "message": "Called second lambda",
-            "savedData": objects_to_store
-        }, default=str)
+        'Key': {'UserId': user['UserId']},
+        'UpdateExpression': 'REMOVE escrowState',
+        'ConditionExpression': 'escrowState = :pending AND (attribute_not_exists(escrowPending) OR escrowPending = :zero)',
+        'ExpressionAttributeValues': {':pending': 'PENDING', ':zero': 0}
     }
 
 
+# predict -> persist -> settle -> payout, plus collect for escrow-mode bids;
+# each stage can be re-run with the same message without repeating its writes
+pipeline_stages = {
+    'predict': run_predict_stage,
+    'persist': run_persist_stage,
+    'settle': run_settle_stage,
+    'payout': run_payout_stage,
+    'collect': run_collect_stage
+}
 
-def update_user_bids_table(winners):
-        # Now handle DB update for those winners
-    winning_bids = []
 
-    for winner in winners:
-        round_id = winner['roundId']
-        model_name = winner['modelName']
-        payoutRatio = winner['payoutRatio']
-
-        response = userBidsTable.query(
-            IndexName='roundId-userId-index',
-            KeyConditionExpression=Key('roundId').eq(round_id)
-            # FilterExpression=Attr('sessionStatus').eq('OPEN')
+def enqueue_stage(stage, payload, context):
+    # Stages hand off through async self-invocations (Lambda retries failed
+    # ones); local runs swap in local_tables.InProcessQueue
+    message = dict(payload, stage=stage)
+    if pipeline_queue is not None:
+        pipeline_queue.send(message)
+        return
+    if context is None:
+        raise Exception(f"No pipeline to hand the {stage} stage to")
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps(message, default=str)
+    )
+
+
+def round_id_for(prediction_candle_timestamp):
+    # One round per predicted candle, whichever run gets there first
+    return str(uuid.uuid5(round_id_namespace, str(prediction_candle_timestamp)))
+
+
+def start_invocation(context):
+    global time_reserve_ms, pages_processed
+    pages_processed = 0
+    time_reserve_ms = settlement_time_reserve_ms
+    if context is not None:
+        # Time left at entry is the function's configured timeout
+        time_reserve_ms = min(settlement_time_reserve_ms,
+                              context.get_remaining_time_in_millis() * settlement_time_reserve_fraction)
+
+
+def out_of_time(context):
+    return (
+        context is not None
+        and pages_processed > 0
+        and context.get_remaining_time_in_millis() < time_reserve_ms
+    )
+
+
+def page_processed():
+    global pages_processed
+    pages_processed += 1
+
+
+def settled_winning_models(round_id, candle_timestamp):
+    # Winning models of a round whose predictions are all settled, else None
+    items = query_all(
+        sessionResultsTable,
+        KeyConditionExpression=Key('candleTimestamp').eq(candle_timestamp),
+        ConsistentRead=True
+    )
+    items = [item for item in items if item.get('roundId') == round_id]
+    if not items or any(item.get('updatedAt') is None for item in items):
+        return None
+    return {item['modelName']: item['payoutRatio'] for item in items if item.get('sessionStatus') == 'WIN'}
+
+
+def get_checkpoints(round_ids):
+    if not round_ids:
+        return {}
+    checkpoints = batch_get_all(settlementCheckpointTable.name, [{'roundId': round_id} for round_id in round_ids])
+    return {checkpoint['roundId']: checkpoint for checkpoint in checkpoints}
+
+
+def settle_round(checkpoint, context=None):
+    # Streams the round's bids page by page, recording after each page how
+    # far it got, so a re-run resumes there. Returns False if it stopped
+    # early for lack of time.
+    round_id = checkpoint['roundId']
+    # Bid writes are conditional, so re-reading a settled page changes nothing
+    for items, next_key in iter_round_bid_pages(round_id, checkpoint.get('lastEvaluatedKey')):
+        if out_of_time(context):
+            return False
+        settle_bid_page(items, checkpoint['winningModels'])
+        save_checkpoint(round_id, 'lastEvaluatedKey', next_key)
+        page_processed()
+
+    set_checkpoint_status(round_id, 'SETTLED')
+    return True
+
+
+def pay_round(checkpoint, context=None):
+    # Second pass over the round's bids, paying the settled winners
+    round_id = checkpoint['roundId']
+    unsent = 0
+    for items, next_key in iter_round_bid_pages(round_id, checkpoint.get('payoutCursor')):
+        if out_of_time(context):
+            return False
+        # The index is eventually consistent: a bid still showing OPEN in a
+        # settled round hasn't caught up yet, so the page is retried later
+        if any(item.get('sessionStatus') == 'OPEN' for item in items):
+            print(f"Round {round_id}: index still shows open bids, retrying payout")
+            return False
+        unsent += pay_bid_page([
+            winning_bid(item, item['payoutAmount'])
+            for item in items
+            if item.get('sessionStatus') == 'WIN' and item.get('payoutStatus') == 'PENDING'
+        ])
+        save_checkpoint(round_id, 'payoutCursor', next_key)
+        page_processed()
+
+    if unsent:
+        # Payouts the chain refused are PENDING again; the round stays
+        # SETTLED so the next settle run queues another pass over it
+        print(f"Round {round_id}: {unsent} payouts not sent, left PENDING")
+        return True
+    set_checkpoint_status(round_id, 'DONE')
+    return True
+
+
+def set_checkpoint_status(round_id, status):
+    settlementCheckpointTable.update_item(
+        Key={'roundId': round_id},
+        UpdateExpression='SET settlementStatus = :status, updatedAt = :updatedAt',
+        ExpressionAttributeValues={':status': status, ':updatedAt': datetime.utcnow().isoformat()}
+    )
+
+
+def start_checkpoint(round_id, winning_models):
+    try:
+        settlementCheckpointTable.put_item(
+            Item={
+                'roundId': round_id,
+                'winningModels': winning_models,
+                'settlementStatus': 'IN_PROGRESS',
+                'createdAt': datetime.utcnow().isoformat()
+            },
+            ConditionExpression='attribute_not_exists(roundId)'
         )
+    except settlementCheckpointTable.meta.client.exceptions.ConditionalCheckFailedException:
+        # Already started by an earlier run; keep its cursors
+        pass
+    return settlementCheckpointTable.get_item(Key={'roundId': round_id}, ConsistentRead=True)['Item']
 
-        items = response.get('Items', [])
 
-        for item in items:
-            user_ids = [bid['userId'] for bid in winning_bids if 'userId' in bid and bid['userId']]
-            if item['userId'] in user_ids:
-                continue
- 
-            new_status = "WIN" if item['prediction'] == model_name else "LOSE"           
+def save_checkpoint(round_id, cursor, key):
+    if key:
+        update = {'UpdateExpression': f'SET {cursor} = :key, updatedAt = :updatedAt',
+                  'ExpressionAttributeValues': {':key': key, ':updatedAt': datetime.utcnow().isoformat()}}
+    else:
+        # Last page: nothing left to resume from
+        update = {'UpdateExpression': f'SET updatedAt = :updatedAt REMOVE {cursor}',
+                  'ExpressionAttributeValues': {':updatedAt': datetime.utcnow().isoformat()}}
+    settlementCheckpointTable.update_item(Key={'roundId': round_id}, **update)
+
 
-            userBidsTable.update_item(
-                Key={
-                    'roundId': item['roundId'], 
+def iter_round_bid_pages(round_id, start_key=None):
+    # Every page of the round's bids, not just the first 1 MB
+    if bid_shard_count > 0:
+        yield from iter_sharded_bid_pages(round_id, start_key)
+        return
+    kwargs = {
+        'IndexName': 'roundId-userId-index',
+        'KeyConditionExpression': Key('roundId').eq(round_id)
+    }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    while True:
+        response = userBidsTable.query(**kwargs)
+        next_key = response.get('LastEvaluatedKey')
+        yield response.get('Items', []), next_key
+        if not next_key:
+            return
+        kwargs['ExclusiveStartKey'] = next_key
+
+
+def iter_sharded_bid_pages(round_id, cursors=None):
+    # Each page is one query per unfinished shard, run in parallel. The
+    # cursor is {shard key: LastEvaluatedKey} for the shards with pages left
+    # (None before the first page), so it checkpoints like a plain key.
+    if not cursors:
+        cursors = {f"{round_id}#{shard}": None for shard in range(bid_shard_count)}
+    while cursors:
+        futures = {
+            shard_key: bid_shard_executor.submit(query_bid_shard, shard_key, start_key)
+            for shard_key, start_key in cursors.items()
+        }
+        items = []
+        next_cursors = {}
+        for shard_key, future in futures.items():
+            shard_items, next_key = future.result()
+            items.extend(shard_items)
+            if next_key:
+                next_cursors[shard_key] = next_key
+        cursors = next_cursors
+        yield items, cursors or None
+
+
+def query_bid_shard(shard_key, start_key=None):
+    kwargs = {
+        'IndexName': 'roundShard-userId-index',
+        'KeyConditionExpression': Key('roundShard').eq(shard_key)
+    }
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    response = userBidsTable.query(**kwargs)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+
+def settle_bid_page(items, winning_models):
+    # Settles the page's OPEN bids; winners are left payoutStatus PENDING for
+    # the payout stage
+    settlements = []
+    settled_users = set()
+
+    for item in items:
+        # One settlement per user per round
+        if item['userId'] in settled_users:
+            continue
+        settled_users.add(item['userId'])
+
+        if item.get('sessionStatus') != 'OPEN':
+            continue
+
+        payoutRatio = winning_models.get(item['prediction'])
+        if payoutRatio is not None:
+            new_status = "WIN"
+            payout = Decimal(item['bidAmount']) * payoutRatio
+        else:
+            new_status = "LOSE"
+            payout = Decimal('0')
+
+        settlements.append({
+            'bid_update': {
+                'TableName': userBidsTable.name,
+                'Key': serialize({
+                    'roundId': item['roundId'],
                     'userId': item['userId']
-                },
-                UpdateExpression="SET sessionStatus = :new_status, payoutAmount = :pay_out",
-                ExpressionAttributeValues={
+                }),
+                'UpdateExpression': "SET sessionStatus = :new_status, payoutAmount = :pay_out, payoutStatus = :payout_status",
+                # Only OPEN bids settle, so a resumed page never settles twice
+                'ConditionExpression': "sessionStatus = :open",
+                'ExpressionAttributeValues': serialize({
                     ':new_status': new_status,  # e.g., 'WIN' or 'LOSE'
-                    ':pay_out': Decimal(item['bidAmount']) * payoutRatio
-                }
-            )
-
-            if new_status == "WIN":
-                winning_bids.append({
-                    'userId': item['userId'],
-                    'payoutAmount': Decimal(item['bidAmount']) * payoutRatio,                    
+                    ':pay_out': payout,
+                    ':payout_status': 'PENDING' if new_status == "WIN" else 'NONE',
+                    ':open': 'OPEN'
                 })
+            },
+            'user_update': user_outcome_update(item, new_status, payout)
+        })
+
+    write_concurrently(settle_bid, settlements)
+
+
+def settle_bid(bid_update, user_update):
+    # The bid's status and the user's profile counters move in one
+    # transaction, so a retried page can neither skip nor double count them
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[{'Update': bid_update}, {'Update': user_update}])
+    except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+        reasons = cancellation_codes(e)
+        if reasons[:1] == ['ConditionalCheckFailed']:
+            # Settled by an earlier or overlapping run
+            return
+        if reasons[1:2] != ['ConditionalCheckFailed']:
+            raise
+        # No user item to count against: settle the bid on its own
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=[{'Update': bid_update}])
+        except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+            if cancellation_codes(e) != ['ConditionalCheckFailed']:
+                raise
+
+
+def cancellation_codes(error):
+    return [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+
+
+def user_outcome_update(item, new_status, payout):
+    # Per-user aggregates read by the Users profile; betCount/totalStaked
+    # are added by the Bid lambda when the bid is placed
+    if new_status == "WIN":
+        expression = 'ADD winCount :one, settledStaked :stake, totalPayout :payout'
+        values = {':one': 1, ':stake': Decimal(item['bidAmount']), ':payout': payout}
+    else:
+        expression = 'ADD lossCount :one, settledStaked :stake'
+        values = {':one': 1, ':stake': Decimal(item['bidAmount'])}
+    return {
+        'TableName': userTable.name,
+        'Key': serialize({'UserId': item['userId']}),
+        'UpdateExpression': expression,
+        # ADD would otherwise create a bare item for an unknown user
+        'ConditionExpression': 'attribute_exists(UserId)',
+        'ExpressionAttributeValues': serialize(values)
+    }
 
-    payout_users(winning_bids)
+
+def winning_bid(item, payout):
+    return {
+        'userId': item['userId'],
+        'roundId': item['roundId'],
+        'payoutAmount': payout,
+    }
+
+
+def pay_bid_page(page_winners):
+    # Claim PENDING -> PAYING before sending; a bid someone else claimed (or
+    # that a crashed run left PAYING) is never sent twice
+    claims = [
+        {
+            'Key': {'roundId': bid['roundId'], 'userId': bid['userId']},
+            'UpdateExpression': "SET payoutStatus = :paying",
+            'ConditionExpression': "payoutStatus = :pending",
+            'ExpressionAttributeValues': {':paying': 'PAYING', ':pending': 'PENDING'}
+        }
+        for bid in page_winners
+    ]
+    claimed = [
+        bid for bid, was_claimed in zip(page_winners, write_concurrently(userBidsTable.update_item, claims))
+        if was_claimed
+    ]
+    if not claimed:
+        return 0
+
+    failed_users, unsent_users = payout_users(claimed)
+
+    write_concurrently(userBidsTable.update_item, [
+        {
+            'Key': {'roundId': bid['roundId'], 'userId': bid['userId']},
+            'UpdateExpression': "SET payoutStatus = :status",
+            'ExpressionAttributeValues': {
+                # Transfers that may or may not have landed need a manual
+                # look; ones that never reached the chain are retried later
+                ':status': 'FAILED' if bid['userId'] in failed_users
+                else 'PENDING' if bid['userId'] in unsent_users
+                else 'PAID'
+            }
+        }
+        for bid in claimed
+    ])
+
+    # Winnings are spendable right away for users bidding from escrow
+    if escrow_mode:
+        write_concurrently(userTable.update_item, [
+            {
+                'Key': {'UserId': bid['userId']},
+                'UpdateExpression': 'ADD escrowBalance :payout',
+                'ConditionExpression': 'attribute_exists(escrowBalance)',
+                'ExpressionAttributeValues': {':payout': bid['payoutAmount']}
+            }
+            for bid in claimed if bid['userId'] not in failed_users and bid['userId'] not in unsent_users
+        ])
+
+    return sum(1 for bid in claimed if bid['userId'] in unsent_users)
+
+
+def write_concurrently(write, requests):
+    # Returns, per request, whether it was applied (False when its
+    # ConditionExpression failed)
+    applied = []
+    # Chunked so a huge round never queues everything at once
+    for i in range(0, len(requests), settlement_chunk_size):
+        chunk = requests[i:i + settlement_chunk_size]
+        # list() surfaces the first failed write once its chunk has finished
+        applied.extend(settlement_executor.map(lambda request: conditional_write(write, request), chunk))
+    return applied
+
+
+def conditional_write(write, request):
+    try:
+        write_with_backoff(write, request)
+        return True
+    except userBidsTable.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def is_retryable(error):
+    code = error.response['Error']['Code']
+    if code == 'TransactionCanceledException':
+        # Cancelled only by throttling or a conflicting write, no failed condition
+        codes = set(cancellation_codes(error)) - {'None'}
+        return bool(codes) and codes <= transaction_retry_codes
+    return code in throttling_error_codes
+
+
+def write_with_backoff(write, request, max_attempts=8):
+    for attempt in range(max_attempts):
+        try:
+            return write(**request)
+        except ClientError as e:
+            if not is_retryable(e) or attempt == max_attempts - 1:
+                raise
+            # Full jitter: 50ms, 100ms, 200ms ... capped at 5s
+            time.sleep(random.uniform(0, min(5, 0.05 * 2 ** attempt)))
 
 
 def payout_users(winning_bids):
     print(winning_bids)
-    user_ids = [bid['userId'] for bid in winning_bids if 'userId' in bid and bid['userId']]
-    keys = [{'UserId': uid} for uid in user_ids]
+    # One transfer per user, even if they won in several rounds
+    payout_by_user = {}
+    for bid in winning_bids:
+        if bid.get('userId'):
+            payout_by_user[bid['userId']] = payout_by_user.get(bid['userId'], Decimal('0')) + bid['payoutAmount']
 
-    if not keys:
-        return
+    if not payout_by_user:
+        return set(), set()
 
-    response = dynamodb.batch_get_item(
-        RequestItems={
-            'Bolt_Hackathon_2025_Users': {
-                'Keys': keys
-            }
+    users = batch_get_all('Bolt_Hackathon_2025_Users', [{'UserId': uid} for uid in payout_by_user])
+
+    transfers = [
+        {
+            "toAddress": user['key'],
+            "amount": float(payout_by_user[user['UserId']])
         }
-    ) 
-    users = response['Responses']['Bolt_Hackathon_2025_Users']
-
-    for user in users:
-        user_id = user['UserId']        
-        for winning_bid in winning_bids:
-            if winning_bid['userId'] == user_id:
-                print("sending to user : ", user_id)
-                payload = {
-                    "method": "send_to_user",
-                    "body": json.dumps({
-                        "toAddress": user['key'],
-                        "amount": float(winning_bid['payoutAmount'])
-                    })
-                }
-                crypto_response = lambda_client.invoke(
-                    FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
-                    InvocationType='RequestResponse',  
-                    Payload=json.dumps(payload)
-                )
-                response_payload = crypto_response['Payload'].read()
-                response_json = json.loads(response_payload)
+        for user in users
+    ]
+    groups = [transfers[i:i + payout_group_size] for i in range(0, len(transfers), payout_group_size)]
+
+    futures = [payout_executor.submit(send_payout_group, group) for group in groups]
+    address_to_user = {user['key']: user['UserId'] for user in users}
 
-                status_code = response_json.get("statusCode")
-                body = json.loads(response_json.get("body"))
+    # Let every group finish, so one failure doesn't strand the rest, and
+    # report which users may have been paid (failed) and which surely weren't
+    failed_users = set()
+    unsent_users = set(payout_by_user) - set(address_to_user.values())
+    for future in futures:
+        unsent, failed = future.result()
+        unsent_users.update(address_to_user[transfer['toAddress']] for transfer in unsent)
+        failed_users.update(address_to_user[transfer['toAddress']] for transfer in failed)
 
-                if status_code != 200:
-                    raise Exception(f"Blockchain balance check failed: {body.get('error', 'Unknown error')}")    
+    # Failed groups may still have landed, so every address is dropped
+    invalidate_balance_cache([transfer['toAddress'] for transfer in transfers])
 
+    return failed_users, unsent_users
+
+
+def invalidate_balance_cache(addresses):
+    if balanceCacheTable is None or not addresses:
+        return
+    try:
+        with balanceCacheTable.batch_writer() as batch:
+            for address in set(addresses):
+                batch.delete_item(Key={'address': address})
+    except Exception as e:
+        # The entries expire on their own shortly
+        print("Balance cache invalidation failed : ", e)
+
+
+def send_payout_group(transfers):
+    print("sending to users : ", [transfer['toAddress'] for transfer in transfers])
+    return send_group("send_to_users", "transfers", transfers)
+
+
+def send_group(method, field, entries):
+    # Sends entries as one atomic group. Returns (entries that surely were
+    # not sent, entries that may or may not have landed). A group the chain
+    # refused is sent again without the entry it blamed, or in halves, so
+    # one bad entry doesn't hold back the other fifteen.
+    try:
+        call_blockchain(method, {field: entries})
+        return [], []
+    except BlockchainNotSubmitted as e:
+        print(f"{method} group not submitted : ", e)
+        if len(entries) == 1:
+            return entries, []
+        index = e.rejected_index
+        if isinstance(index, int) and 0 <= index < len(entries):
+            unsent, failed = send_group(method, field, entries[:index] + entries[index + 1:])
+            return [entries[index]] + unsent, failed
+        middle = len(entries) // 2
+        first_unsent, first_failed = send_group(method, field, entries[:middle])
+        second_unsent, second_failed = send_group(method, field, entries[middle:])
+        return first_unsent + second_unsent, first_failed + second_failed
+    except Exception as e:
+        print(f"{method} group failed : ", e)
+        return [], entries
+
+
+def send_collect_group(users):
+    print("collecting from users : ", [user['UserId'] for user in users])
+    mnemonic_to_user = {user['mnemonic']: user for user in users}
+    unsent, failed = send_group("collect_from_users", "collections", [
+        {"fromMnemonic": user['mnemonic'], "amount": float(user['escrowPending'])}
+        for user in users
+    ])
+    return ([mnemonic_to_user[entry['fromMnemonic']] for entry in unsent],
+            [mnemonic_to_user[entry['fromMnemonic']] for entry in failed])
+
+
+def get_chain_balances(addresses):
+    # null for addresses the node couldn't look up
+    balances = {}
+    for i in range(0, len(addresses), 100):
+        balances.update(call_blockchain("balances", {"addresses": addresses[i:i + 100]}).get("balances", {}))
+    return balances
+
+
+class BlockchainNotSubmitted(Exception):
+    def __init__(self, message, rejected_index=None):
+        super().__init__(message)
+        self.rejected_index = rejected_index
+
+
+def call_blockchain(method, body):
+    payload = {
+        "method": method,
+        "body": json.dumps(body)
+    }
+    crypto_response = lambda_client.invoke(
+        FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
+        InvocationType='RequestResponse',  
+        Payload=json.dumps(payload)
+    )
+    response_payload = crypto_response['Payload'].read()
+    response_json = json.loads(response_payload)
+
+    status_code = response_json.get("statusCode")
+    body = json.loads(response_json.get("body"))
+
+    if status_code != 200:
+        message = f"Blockchain {method} failed: {body.get('error', 'Unknown error')}"
+        # Bad requests never reach the chain; group methods also say when
+        # algod refused the group outright
+        if status_code == 400 or body.get('submitted') is False:
+            raise BlockchainNotSubmitted(message, body.get('rejectedIndex'))
+        raise Exception(message)
+
+    return body
+
+
+def query_all(table, **kwargs):
+    # Follow LastEvaluatedKey through every page
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def batch_get_all(table_name, keys, max_attempts=8):
+    # batch_get_item takes at most 100 keys and may hand some back unprocessed
+    items = []
+    for i in range(0, len(keys), 100):
+        request = {table_name: {'Keys': keys[i:i + 100]}}
+        for attempt in range(max_attempts):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(random.uniform(0, min(5, 0.05 * 2 ** attempt)))
+        if request:
+            raise Exception(f"Could not read {len(request[table_name]['Keys'])} keys from {table_name}")
+    return items
 
 
 def invoke_prediction_lambda():
@@ -193,119 +943,196 @@ def build_objects_to_store(model_name, prediction,prediction_candle_timestamp,pr
         'createdAt': datetime.utcnow().isoformat(), # unique identifier 
         'updatedAt': None,
         'payoutRatio': Decimal(payout_ratio),
-        'sessionStatus': None
+        'sessionStatus': None,
+        # Sparse index key, removed at settlement
+        'pendingSettlement': 'PENDING'
     }
     return item
 
 def store_prediction(items_to_store):
-    with sessionResultsTable.batch_writer() as batch:
-        for item in items_to_store:
-            batch.put_item(Item=item)
-
-def update_actual_value(actualData, uniqueModals):
-    if not actualData:
-        print("No data provided.")
-        return
+    # Conditional so a retried persist never resets an already settled result
+    write_concurrently(sessionResultsTable.put_item, [
+        {
+            'Item': item,
+            'ConditionExpression': 'attribute_not_exists(candleTimestamp)'
+        }
+        for item in items_to_store
+    ])
 
+def closed_candles(actualData):
     # Step 1: Normalize and validate entries
     valid_actual_data = [
-        entry for entry in actualData
+        entry for entry in actualData or []
         if isinstance(entry, dict) and 'timestamp' in entry and 'close' in entry
     ]
 
-    if not valid_actual_data:
-        print("No valid entries found.")
-        return
-
-    # Step 2: Build lookup for candles by timestamp
-    actual_data_candle_map = {entry['timestamp']: entry for entry in valid_actual_data}
+    # Step 2: The newest candle is still forming, so only the ones before it
+    # can settle predictions
+    valid_actual_data.sort(key=lambda entry: entry['timestamp'])
+    return valid_actual_data[:-1]
+
+def update_actual_value(actualData):
+    closed = closed_candles(actualData)
+    if not closed:
+        print("No closed candles yet.")
+        return []
+    actual_data_candle_map = {entry['timestamp']: entry for entry in closed}
+
+    # Step 3: Pending predictions for those candles, from the sparse index
+    # (pendingSettlement only exists until the prediction is settled)
+    keys = query_all(
+        sessionResultsTable,
+        IndexName='pendingSettlement-candleTimestamp-index',
+        KeyConditionExpression=Key('pendingSettlement').eq('PENDING') & Key('candleTimestamp').between(
+            closed[0]['timestamp'], closed[-1]['timestamp'])
+    )
 
-    # Step 4: Prepare composite keys for batch_get_item
-    keys = [
+    # Step 4: Full items (the index only needs to project keys)
+    items_to_update = batch_get_all(sessionResultsTable.name, [
         {
-            'candleTimestamp': timestamp,
-            'modelName': model_name
+            'candleTimestamp': key['candleTimestamp'],
+            'modelName': key['modelName']
         }
-        for timestamp in actual_data_candle_map
-        for model_name in uniqueModals
-    ]
-
-    # Step 5: Batch get in chunks of 100
-    chunks = [keys[i:i + 100] for i in range(0, len(keys), 100)]
-    items_to_update = []
-
-    for chunk in chunks:
-        # print("chunk:", chunk)
-        response = sessionResultsTable.meta.client.batch_get_item(
-            RequestItems={
-                sessionResultsTable.name: {
-                    'Keys': chunk
-                }
-            }
-        )
-        returned_items = response['Responses'].get(sessionResultsTable.name, [])
-        # print("returned items:", returned_items)
-
-        for item in returned_items:
-            if item.get('accuracy') is None:
-                items_to_update.append(item)
+        for key in keys
+    ])
     
+    # Step 5: Score every pending prediction in one pass
+    items_to_update = [item for item in items_to_update if item['candleTimestamp'] in actual_data_candle_map]
+    scores = score_predictions(
+        to_float_array(item.get('prediction') for item in items_to_update),
+        to_float_array(item.get('previousClose') for item in items_to_update),
+        to_float_array(actual_data_candle_map[item['candleTimestamp']]['close'] for item in items_to_update)
+    )
+
     winners = []
     # Step 6: Update only items missing "accuracy"
-    for item in items_to_update:
+    for i, item in enumerate(items_to_update):
         ts = item['candleTimestamp']
         model_name = item['modelName']
         updated_round_id = item['roundId']
         payoutRatio = item['payoutRatio']
-        candle = actual_data_candle_map.get(ts)
-
-        # print(ts, model_name, candle)
-
-        if candle and 'close' in candle:
-            try:
-                close_price = Decimal(candle['close'])
-                # previous_close = Decimal(item['previousClose'])    
-                prediction = Decimal(item['prediction'])    
-                if close_price == 0:
-                    accuracy = None
-                else:
-                    accuracy = 1 - (abs(close_price - prediction) / close_price)
-            except (InvalidOperation, TypeError, ValueError):
-                accuracy = None
-            updatedAt = datetime.utcnow().isoformat()
-            actualClose = candle['close']
-
-            sessionStatus = "WIN" if accuracy is not None and accuracy > payout_threshold else "LOSE"
-            
-            sessionResultsTable.update_item(
-                Key={
-                    'candleTimestamp': ts,
-                    'modelName': model_name
+        candle = actual_data_candle_map[ts]
+
+        # Decimals only from here on, for storage
+        accuracy = to_decimal(scores['accuracy'][i])
+        updatedAt = datetime.utcnow().isoformat()
+        actualClose = candle['close']
+        won = bool(scores['win'][i])
+
+        sessionStatus = "WIN" if won else "LOSE"
+        
+        try:
+            # The prediction and the model's lifetime counters settle in one
+            # transaction, so a retry never finds one without the other
+            write_with_backoff(dynamodb.meta.client.transact_write_items, {'TransactItems': [
+                {
+                    'Update': {
+                        'TableName': sessionResultsTable.name,
+                        'Key': serialize({
+                            'candleTimestamp': ts,
+                            'modelName': model_name
+                        }),
+                        'UpdateExpression': 'SET accuracy = :accuracy, updatedAt = :updatedAt, actualClose = :actualClose, sessionStatus = :sessionStatus, '
+                                            'directionHit = :directionHit, absolutePercentError = :ape, brierScore = :brier REMOVE pendingSettlement',
+                        # updatedAt is only set here, so a prediction is settled
+                        # (and counted in the model stats) exactly once
+                        'ConditionExpression': 'attribute_not_exists(updatedAt) OR attribute_type(updatedAt, :null)',
+                        'ExpressionAttributeValues': serialize({
+                            ':accuracy': accuracy,
+                            ':updatedAt': updatedAt,
+                            ':actualClose': actualClose,
+                            ':sessionStatus': sessionStatus,
+                            ':directionHit': to_bool(scores['directionHit'][i], scores['directionValid'][i]),
+                            ':ape': to_decimal(scores['absolutePercentError'][i]),
+                            ':brier': to_decimal(scores['brierScore'][i]),
+                            ':null': 'NULL'
+                        })
+                    }
                 },
-                UpdateExpression='SET accuracy = :accuracy, updatedAt = :updatedAt, actualClose = :actualClose, sessionStatus = :sessionStatus',
-                ExpressionAttributeValues={
-                    ':accuracy': accuracy,
-                    ':updatedAt': updatedAt,
-                    ':actualClose': actualClose,
-                    ':sessionStatus': sessionStatus
+                {
+                    'Update': model_outcome_update(model_name, sessionStatus, ts)
                 }
-            )
-            if accuracy is not None and accuracy > payout_threshold:
-                winners.append({
-                    'roundId': updated_round_id,
-                    'modelName': model_name,
-                    'payoutRatio': payoutRatio
-                })
-
-        if not winners:
-            winners.append({
-                'roundId': updated_round_id,
-                'modelName': '',
-                'payoutRatio': 0
-            })
+            ]})
+        except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+            reasons = cancellation_codes(e)
+            if not reasons or reasons[0] != 'ConditionalCheckFailed':
+                raise
+            # Settled by an earlier or overlapping run
+
+        # Every settled round is reported, with modelName '' when this model
+        # lost, so rounds nobody won still get their bids settled
+        winners.append({
+            'roundId': updated_round_id,
+            'candleTimestamp': ts,
+            'modelName': model_name if won else '',
+            'payoutRatio': payoutRatio if won else 0
+        })
 
     return winners
 
+def score_predictions(predictions, previous_closes, actual_closes):
+    # Vectorized scoring for any number of models x rounds (arrays that
+    # broadcast together, e.g. [models, rounds] predictions against [rounds]
+    # closes; NaN where a value is missing or unparseable). Used by the live
+    # settlement, backtest.py and rescore.py.
+    predictions, previous_closes, actual_closes = np.broadcast_arrays(
+        np.asarray(predictions, dtype=np.float64),
+        np.asarray(previous_closes, dtype=np.float64),
+        np.asarray(actual_closes, dtype=np.float64)
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_error = np.where(actual_closes == 0, np.nan, np.abs(actual_closes - predictions) / actual_closes)
+        accuracy = 1 - relative_error
+        predicted_move = (predictions - previous_closes) / previous_closes
+        up_probability = 1 / (1 + np.exp(-brier_scale * predicted_move))
+
+    valid = np.isfinite(accuracy)
+    direction_valid = valid & np.isfinite(predicted_move)
+    actual_up = actual_closes > previous_closes
+
+    return {
+        'valid': valid,
+        'accuracy': accuracy,
+        'relativeError': relative_error,
+        'win': valid & (accuracy > float(payout_threshold)),
+        # Flat predictions only hit on a flat close
+        'directionHit': direction_valid & (np.sign(predictions - previous_closes) == np.sign(actual_closes - previous_closes)),
+        'directionValid': direction_valid,
+        'absolutePercentError': relative_error * 100,
+        'brierScore': np.where(direction_valid, (up_probability - actual_up) ** 2, np.nan)
+    }
+
+def summarize_scores(scores, axis=-1):
+    # Per-model (or per-round) aggregates: win rate, direction hit rate, MAPE
+    # and mean Brier score
+    settled = scores['valid'].sum(axis=axis)
+    directional = scores['directionValid'].sum(axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'settled': settled,
+            'winRate': scores['win'].sum(axis=axis) / settled,
+            'directionHitRate': scores['directionHit'].sum(axis=axis) / directional,
+            'mape': np.where(scores['valid'], scores['absolutePercentError'], 0).sum(axis=axis) / settled,
+            'brier': np.where(scores['directionValid'], scores['brierScore'], 0).sum(axis=axis) / directional
+        }
+
+def to_float_array(values):
+    floats = []
+    for value in values:
+        try:
+            floats.append(float(str(value).strip('.')))
+        except (TypeError, ValueError):
+            floats.append(np.nan)
+    return np.array(floats, dtype=np.float64)
+
+def to_decimal(value):
+    # NaN (unparseable prediction, zero close) is stored as null, as before
+    return Decimal(repr(float(value))) if np.isfinite(value) else None
+
+def to_bool(value, valid):
+    return bool(value) if valid else None
+
 def storeSessionObject(prediction_candle_timestamp,models,round_id):
     item = {
         'roundId': round_id,
@@ -315,7 +1142,57 @@ def storeSessionObject(prediction_candle_timestamp,models,round_id):
         'type': 'round'
         # 'updatedAt': None
     }
-    sessionsTable.put_item(Item=item)
+    try:
+        sessionsTable.put_item(Item=item, ConditionExpression='attribute_not_exists(roundId)')
+    except sessionsTable.meta.client.exceptions.ConditionalCheckFailedException:
+        # Round already opened by an earlier attempt
+        pass
+
+def model_outcome_update(model_name, sessionStatus, candle_timestamp):
+    # Lifetime counters and the round's ring slot, written in the same
+    # transaction as the settle
+    return {
+        'TableName': modelStatsTable.name,
+        'Key': serialize({'modelName': model_name}),
+        'UpdateExpression': 'ADD settledCount :one, winCount :win, lossCount :loss SET #slot = :outcome',
+        'ExpressionAttributeNames': {'#slot': f'recent{ring_slot(candle_timestamp)}'},
+        'ExpressionAttributeValues': serialize({
+            ':one': 1,
+            ':win': 1 if sessionStatus == 'WIN' else 0,
+            ':loss': 0 if sessionStatus == 'WIN' else 1,
+            ':outcome': sessionStatus
+        })
+    }
+
+
+def ring_slot(candle_timestamp):
+    # Each 5 minute round owns one slot, so a retried or concurrent settle
+    # always writes the same one. Candle timestamps are ISO strings in
+    # production and epoch milliseconds in some callers.
+    if isinstance(candle_timestamp, str):
+        seconds = datetime.fromisoformat(candle_timestamp.replace('Z', '+00:00')).timestamp()
+    else:
+        seconds = float(candle_timestamp) / 1000
+    return int(seconds // 300) % model_stats_ring_size
+
+
+def serialize(values):
+    return {name: serializer.serialize(value) for name, value in values.items()}
+
+def recent_win_rate(stats):
+    outcomes = [stats.get(f'recent{slot}') for slot in range(model_stats_ring_size)]
+    win_count = outcomes.count('WIN')
+    total = win_count + outcomes.count('LOSE')
+    return win_count / total if total else 0
+
+def get_model_win_rates(model_names):
+    stats = batch_get_all('Bolt_Hackathon_2025_Model_Stats', [{'modelName': name} for name in model_names])
+    win_rates = {item['modelName']: recent_win_rate(item) for item in stats}
+    for model_name in model_names:
+        if model_name not in win_rates:
+            # No aggregate yet (model settled before stats existed, or new)
+            win_rates[model_name] = getAverageAccuracy(model_name)
+    return win_rates
 
 def getAverageAccuracy(model_name):
     # Query GSI (assuming it's named 'model_name-timestamp-index')
@@ -330,7 +1207,12 @@ def getAverageAccuracy(model_name):
 
     win_count = sum(1 for item in items if item.get('sessionStatus') == 'WIN')
     lose_count = sum(1 for item in items if item.get('sessionStatus') == 'LOSE')
-    avg_accuracy = win_count / (lose_count + win_count)
+    total = win_count + lose_count
+
+    if total == 0:
+        avg_accuracy = 0  # new model, no settled rounds yet
+    else:
+        avg_accuracy = win_count / total
 
     return avg_accuracy
 
@@ -340,6 +1222,9 @@ def calculate_payout(avg_accuracy):
     max_payout = Decimal('5')
 
     avg_accuracy = Decimal(str(avg_accuracy))
+    if avg_accuracy == 0:
+        # No wins on record (or a brand new model): pay the maximum
+        return max_payout
     # if avg_accuracy >= Decimal('1'):
     #     return Decimal('0')
     # if avg_accuracy >= payout_threshold:
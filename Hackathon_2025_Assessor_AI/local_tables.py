@@ -0,0 +1,566 @@
+import re
+import copy
+import json
+import time
+import bisect
+from collections import deque
+from contextlib import contextmanager
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeDeserializer
+
+# In-memory stand-ins for the boto3 DynamoDB Table/resource calls this lambda
+# makes, so the Assessor logic can run offline (backtest.py, local pipeline).
+# Only the expression forms the lambda actually uses are understood.
+# InProcessQueue stands in for the async hand-offs between pipeline stages.
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class TransactionCanceledException(ClientError):
+    pass
+
+
+class _Exceptions:
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    TransactionCanceledException = TransactionCanceledException
+
+
+def _throughput_exceeded(operation):
+    return ClientError(
+        {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Partition write capacity exceeded'}},
+        operation
+    )
+
+
+def _condition_test(item, condition):
+    # boto3.dynamodb.conditions objects (Key/Attr) from KeyConditionExpression
+    # and FilterExpression
+    expression = condition.get_expression()
+    operator = expression['operator']
+    values = expression['values']
+    if operator == 'AND':
+        return _condition_test(item, values[0]) and _condition_test(item, values[1])
+    if operator == 'OR':
+        return _condition_test(item, values[0]) or _condition_test(item, values[1])
+    if operator == 'NOT':
+        return not _condition_test(item, values[0])
+
+    name = values[0].name
+    if operator == 'attribute_exists':
+        return name in item
+    if operator == 'attribute_not_exists':
+        return name not in item
+    if name not in item:
+        return False
+    value = item[name]
+    if operator == '=':
+        return value == values[1]
+    if operator == '<>':
+        return value != values[1]
+    if operator == '<':
+        return value < values[1]
+    if operator == '<=':
+        return value <= values[1]
+    if operator == '>':
+        return value > values[1]
+    if operator == '>=':
+        return value >= values[1]
+    if operator == 'BETWEEN':
+        return values[1] <= value <= values[2]
+    if operator == 'begins_with':
+        return value.startswith(values[1])
+    raise NotImplementedError(f"Condition operator not supported locally: {operator}")
+
+
+def _resolve(token, names, values):
+    token = token.strip()
+    if token.startswith(':'):
+        return values[token]
+    return names.get(token, token)
+
+
+def _split_top_level(expression, separator):
+    # Split on separator outside parentheses
+    parts, depth, start = [], 0, 0
+    i = 0
+    while i < len(expression):
+        char = expression[i]
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and expression.startswith(separator, i):
+            parts.append(expression[start:i])
+            i += len(separator)
+            start = i
+            continue
+        i += 1
+    parts.append(expression[start:])
+    return [part.strip() for part in parts]
+
+
+def _unwrap(clause):
+    # Drop parentheses that wrap the whole clause
+    clause = clause.strip()
+    while clause.startswith('(') and clause.endswith(')'):
+        depth = 0
+        for i, char in enumerate(clause):
+            depth += char == '('
+            depth -= char == ')'
+            if depth == 0 and i < len(clause) - 1:
+                return clause
+        clause = clause[1:-1].strip()
+    return clause
+
+
+def _string_condition_test(item, expression, names, values):
+    # String ConditionExpressions: AND / OR with parentheses
+    expression = _unwrap(expression)
+    alternatives = _split_top_level(expression, ' OR ')
+    if len(alternatives) > 1:
+        return any(_string_condition_test(item, part, names, values) for part in alternatives)
+    clauses = _split_top_level(expression, ' AND ')
+    if len(clauses) > 1:
+        return all(_string_condition_test(item, part, names, values) for part in clauses)
+    clause = expression
+    match = re.match(r'(attribute_exists|attribute_not_exists)\((.+)\)$', clause)
+    if match:
+        exists = _resolve(match.group(2), names, values) in item
+        return exists == (match.group(1) == 'attribute_exists')
+    match = re.match(r'attribute_type\((.+),\s*(:\w+)\)$', clause)
+    if match:
+        name = _resolve(match.group(1), names, values)
+        return values[match.group(2)] == 'NULL' and name in item and item[name] is None
+    match = re.match(r'(.+?)\s*(<>|<=|>=|=|<|>)\s*(.+)$', clause)
+    if not match:
+        raise NotImplementedError(f"Condition not supported locally: {clause}")
+    if match.group(1).strip().startswith(':'):
+        left = values[match.group(1).strip()]
+    else:
+        name = _resolve(match.group(1), names, values)
+        # Comparisons against a missing attribute are false
+        if name not in item:
+            return False
+        left = item[name]
+    right = _resolve(match.group(3), names, values)
+    return {
+        '=': left == right, '<>': left != right, '<': left < right,
+        '<=': left <= right, '>': left > right, '>=': left >= right
+    }[match.group(2)]
+
+
+def _operand(item, token, names, values):
+    # :value, attribute, or if_not_exists(attribute, :value)
+    token = token.strip()
+    match = re.match(r'if_not_exists\((.+),\s*(.+)\)$', token)
+    if match:
+        name = _resolve(match.group(1), names, values)
+        return item[name] if name in item else _resolve(match.group(2), names, values)
+    if token.startswith(':'):
+        return values[token]
+    name = _resolve(token, names, values)
+    if name not in item:
+        raise ValueError(f"The provided expression refers to an attribute that does not exist: {name}")
+    return item[name]
+
+
+def _apply_update(item, expression, names, values):
+    # SET a = :a, b = c - :d, e = if_not_exists(e, :e)   ADD c :one   REMOVE d
+    # Every operand reads the item as it was before the update
+    before = copy.deepcopy(item)
+    sections = re.split(r'\b(SET|ADD|REMOVE)\b', expression)
+    action = None
+    for part in sections:
+        part = part.strip()
+        if part in ('SET', 'ADD', 'REMOVE'):
+            action = part
+            continue
+        if not part:
+            continue
+        for clause in [c for c in _split_top_level(part, ',') if c]:
+            if action == 'SET':
+                target, source = [side.strip() for side in clause.split('=', 1)]
+                terms = _split_top_level(source, ' + ')
+                sign = 1
+                if len(terms) == 1:
+                    terms = _split_top_level(source, ' - ')
+                    sign = -1
+                value = _operand(before, terms[0], names, values)
+                if len(terms) == 2:
+                    value = value + sign * _operand(before, terms[1], names, values)
+                item[_resolve(target, names, values)] = copy.deepcopy(value)
+            elif action == 'ADD':
+                target, source = clause.split()
+                name = _resolve(target, names, values)
+                item[name] = item.get(name, 0) + _resolve(source, names, values)
+            elif action == 'REMOVE':
+                item.pop(_resolve(clause, names, values), None)
+
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self.table.delete_item(Key=Key)
+
+
+class InMemoryTable:
+    def __init__(self, name, key_names, indexes=None):
+        # key_names: (partition, sort) or (partition,)
+        # indexes: {'index-name': (partition, sort)}
+        self.name = name
+        self.key_names = tuple(key_names)
+        self.indexes = indexes or {}
+        self.items = {}
+        # index name -> partition value -> sorted [(sort value, primary key)]
+        self.index_data = {index_name: {} for index_name in self.indexes}
+        self.meta = type('Meta', (), {'client': None})()
+        self.read_count = 0
+        self.write_count = 0
+        # Items per query page when no Limit is given (DynamoDB's 1 MB cap)
+        self.page_size = None
+        # Writes per second each table or index partition accepts, like
+        # DynamoDB's per-partition limit; None means unlimited. clock can be
+        # swapped for a simulated one.
+        self.partition_write_capacity = None
+        self.clock = time.monotonic
+        self.throttled_count = 0
+        # (index name or None, partition value) -> (tokens, last refill)
+        self.partition_tokens = {}
+
+    def _key(self, item):
+        return tuple(item[name] for name in self.key_names)
+
+    def _index_remove(self, item):
+        for index_name, (partition, sort) in self.indexes.items():
+            if partition in item and (sort is None or sort in item):
+                entries = self.index_data[index_name].get(item[partition], [])
+                entry = (item.get(sort) if sort else None, self._key(item))
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    entries.pop(position)
+
+    def _index_add(self, item):
+        for index_name, (partition, sort) in self.indexes.items():
+            # Sparse indexes: items without the key attributes are left out
+            if partition in item and (sort is None or sort in item):
+                entries = self.index_data[index_name].setdefault(item[partition], [])
+                bisect.insort(entries, (item.get(sort) if sort else None, self._key(item)))
+
+    def _partitions(self, item):
+        partitions = [(None, item[self.key_names[0]])]
+        for index_name, (partition, sort) in self.indexes.items():
+            if partition in item and (sort is None or sort in item):
+                partitions.append((index_name, item[partition]))
+        return partitions
+
+    def _consume_write_capacity(self, items, operation, dry_run=False):
+        # One token per write on the base partition and on every index
+        # partition it touches; all or nothing
+        if self.partition_write_capacity is None:
+            return
+        now = self.clock()
+        needed = {}
+        for item in items:
+            for partition in self._partitions(item):
+                needed[partition] = needed.get(partition, 0) + 1
+        refilled = {}
+        for partition, count in needed.items():
+            tokens, last = self.partition_tokens.get(partition, (self.partition_write_capacity, now))
+            tokens = min(self.partition_write_capacity, tokens + (now - last) * self.partition_write_capacity)
+            if tokens < count:
+                self.throttled_count += 1
+                raise _throughput_exceeded(operation)
+            refilled[partition] = tokens - count
+        if dry_run:
+            return
+        for partition, tokens in refilled.items():
+            self.partition_tokens[partition] = (tokens, now)
+
+    def _check(self, current, ConditionExpression, names, values):
+        if ConditionExpression is None:
+            return
+        item = current or {}
+        if isinstance(ConditionExpression, str):
+            passed = _string_condition_test(item, ConditionExpression, names, values)
+        else:
+            passed = _condition_test(item, ConditionExpression)
+        if not passed:
+            raise ConditionalCheckFailedException("The conditional request failed")
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None):
+        key = self._key(Item)
+        current = self.items.get(key)
+        self._check(current, ConditionExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+        self._consume_write_capacity([Item] + ([current] if current else []), 'PutItem')
+        if current is not None:
+            self._index_remove(current)
+        self.items[key] = copy.deepcopy(Item)
+        self._index_add(self.items[key])
+        self.write_count += 1
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self.read_count += 1
+        item = self.items.get(self._key(Key))
+        return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None):
+        key = self._key(Key)
+        current = self.items.get(key)
+        self._check(current, ConditionExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {})
+        self._consume_write_capacity([current] if current else [dict(Key)], 'DeleteItem')
+        if current is not None:
+            self._index_remove(current)
+            del self.items[key]
+        self.write_count += 1
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, ConditionExpression=None, ReturnValues=None):
+        key = self._key(Key)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        current = self.items.get(key)
+        self._check(current, ConditionExpression, names, values)
+        item = copy.deepcopy(current) if current is not None else dict(Key)
+        _apply_update(item, UpdateExpression, names, values)
+        self._consume_write_capacity([item] + ([current] if current else []), 'UpdateItem')
+        if current is not None:
+            self._index_remove(current)
+        self.items[key] = item
+        self._index_add(item)
+        self.write_count += 1
+        if ReturnValues in ('ALL_NEW', 'UPDATED_NEW'):
+            return {'Attributes': copy.deepcopy(item)}
+        return {}
+
+    def query(self, KeyConditionExpression, IndexName=None, FilterExpression=None,
+              ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kwargs):
+        if IndexName:
+            partition, sort = self.indexes[IndexName]
+        else:
+            partition, sort = self.key_names[0], (self.key_names[1] if len(self.key_names) > 1 else None)
+
+        partition_value = _find_partition_value(KeyConditionExpression, partition)
+        if IndexName:
+            entries = self.index_data[IndexName].get(partition_value, [])
+            candidates = [self.items[primary] for _, primary in entries]
+        else:
+            candidates = sorted(
+                (item for item in self.items.values() if item.get(partition) == partition_value),
+                key=lambda item: item.get(sort) if sort else 0
+            )
+        candidates = [item for item in candidates if _condition_test(item, KeyConditionExpression)]
+        if not ScanIndexForward:
+            candidates.reverse()
+
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            for position, item in enumerate(candidates):
+                if self._key(item) == start:
+                    candidates = candidates[position + 1:]
+                    break
+
+        # Like DynamoDB, Limit caps items *evaluated*, before the filter
+        Limit = Limit or self.page_size
+        page = candidates[:Limit] if Limit else candidates
+        self.read_count += len(page)
+        result = {'Items': [
+            copy.deepcopy(item) for item in page
+            if FilterExpression is None or _condition_test(item, FilterExpression)
+        ]}
+        if Limit and len(candidates) > Limit:
+            result['LastEvaluatedKey'] = {name: page[-1][name] for name in self.key_names}
+        return result
+
+    def scan(self, ExclusiveStartKey=None, **kwargs):
+        self.read_count += len(self.items)
+        return {'Items': [copy.deepcopy(item) for item in self.items.values()]}
+
+    @contextmanager
+    def batch_writer(self, overwrite_by_pkeys=None):
+        yield _BatchWriter(self)
+
+
+def _find_partition_value(condition, partition):
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        for part in expression['values']:
+            value = _find_partition_value(part, partition)
+            if value is not None:
+                return value
+        return None
+    if expression['operator'] == '=' and expression['values'][0].name == partition:
+        return expression['values'][1]
+    return None
+
+
+class InMemoryClient:
+    # The low-level client calls the lambda makes through table.meta.client
+    # or the dynamodb resource
+    exceptions = _Exceptions
+
+    def __init__(self, tables):
+        self.tables = {table.name: table for table in tables}
+        for table in tables:
+            table.meta.client = self
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.tables[table_name]
+            found = [table.get_item(Key=key).get('Item') for key in request['Keys']]
+            responses[table_name] = [item for item in found if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def transact_write_items(self, TransactItems):
+        # Low-level (typed) attribute values; every condition is checked
+        # before anything is written, and a throttled write cancels the lot
+        deserializer = TypeDeserializer()
+
+        def plain(values):
+            return {name: deserializer.deserialize(value) for name, value in (values or {}).items()}
+
+        operations = []
+        reasons = []
+        for transact_item in TransactItems:
+            (operation, spec), = transact_item.items()
+            table = self.tables[spec['TableName']]
+            key = plain(spec['Item'] if operation == 'Put' else spec['Key'])
+            operations.append((operation, spec, table, key))
+            try:
+                table._check(table.items.get(table._key(key)), spec.get('ConditionExpression'),
+                             spec.get('ExpressionAttributeNames') or {}, plain(spec.get('ExpressionAttributeValues')))
+                reasons.append({'Code': 'None'})
+            except ConditionalCheckFailedException:
+                reasons.append({'Code': 'ConditionalCheckFailed'})
+
+        def cancel(reasons):
+            raise TransactionCanceledException(
+                {'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                 'CancellationReasons': reasons},
+                'TransactWriteItems'
+            )
+
+        if any(reason['Code'] != 'None' for reason in reasons):
+            cancel(reasons)
+
+        # Capacity for the whole transaction before any of it is written
+        touched = {}
+        for operation, spec, table, key in operations:
+            current = table.items.get(table._key(key))
+            items = touched.setdefault(table.name, [])
+            if current:
+                items.append(current)
+            if operation == 'Put':
+                items.append(key)
+            elif operation == 'Update':
+                updated = copy.deepcopy(current) if current else dict(key)
+                _apply_update(updated, spec['UpdateExpression'], spec.get('ExpressionAttributeNames') or {},
+                              plain(spec.get('ExpressionAttributeValues')))
+                items.append(updated)
+            elif not current:
+                items.append(key)
+        for table_name, items in touched.items():
+            try:
+                self.tables[table_name]._consume_write_capacity(items, 'TransactWriteItems', dry_run=True)
+            except ClientError:
+                cancel([
+                    {'Code': 'ThrottlingError' if table.name == table_name else 'None'}
+                    for _, _, table, _ in operations
+                ])
+
+        for operation, spec, table, key in operations:
+            if operation == 'Put':
+                table.put_item(Item=key)
+            elif operation == 'Delete':
+                table.delete_item(Key=key)
+            else:
+                table.update_item(Key=key, UpdateExpression=spec['UpdateExpression'],
+                                  ExpressionAttributeNames=spec.get('ExpressionAttributeNames'),
+                                  ExpressionAttributeValues=plain(spec.get('ExpressionAttributeValues')))
+
+
+class InMemoryResource:
+    # Stands in for boto3.resource('dynamodb')
+    def __init__(self, tables):
+        self.client = InMemoryClient(tables)
+        self.meta = type('Meta', (), {'client': self.client})()
+
+    def Table(self, name):
+        return self.client.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        return self.client.batch_get_item(RequestItems)
+
+
+class InProcessQueue:
+    # Stands in for the async self-invocations between pipeline stages;
+    # drain() runs queued stages one after another until none are left
+    def __init__(self):
+        self.messages = deque()
+        self.sent = []
+
+    def send(self, message):
+        # Same JSON round trip a Lambda payload goes through
+        message = json.loads(json.dumps(message, default=str))
+        self.messages.append(message)
+        self.sent.append(message['stage'])
+
+    def drain(self, handler, context=None):
+        processed = 0
+        while self.messages:
+            handler(self.messages.popleft(), context)
+            processed += 1
+        return processed
+
+
+def assessor_tables():
+    # Key schemas and indexes the Assessor relies on
+    session_results = InMemoryTable(
+        'Bolt_Hackathon_2025_Session_Results', ('candleTimestamp', 'modelName'),
+        {'modelName-candleTimestamp-index': ('modelName', 'candleTimestamp'),
+         'roundId-index': ('roundId', None),
+         'pendingSettlement-candleTimestamp-index': ('pendingSettlement', 'candleTimestamp')}
+    )
+    sessions = InMemoryTable(
+        'Bolt_Hackathon_2025_Sessions', ('roundId',),
+        {'roundId-index': ('roundId', None),
+         'type-candleTimestamp-index': ('type', 'candleTimestamp')}
+    )
+    users = InMemoryTable(
+        'Bolt_Hackathon_2025_Users', ('UserId',),
+        {'escrowState-index': ('escrowState', None)}
+    )
+    checkpoints = InMemoryTable('Bolt_Hackathon_2025_Settlement_Checkpoints', ('roundId',))
+    user_bids = InMemoryTable(
+        'Bolt_Hackathon_2025_User_Bids', ('userId', 'roundId'),
+        {'roundId-userId-index': ('roundId', 'userId'),
+         'roundShard-userId-index': ('roundShard', 'userId'),
+         'userId-index': ('userId', None)}
+    )
+    model_stats = InMemoryTable('Bolt_Hackathon_2025_Model_Stats', ('modelName',))
+    return InMemoryResource([session_results, sessions, users, user_bids, model_stats, checkpoints])
+
+
+def install(lambda_module, resource):
+    # Point the lambda's module-level tables at the in-memory ones
+    lambda_module.dynamodb = resource
+    lambda_module.sessionResultsTable = resource.Table('Bolt_Hackathon_2025_Session_Results')
+    lambda_module.sessionsTable = resource.Table('Bolt_Hackathon_2025_Sessions')
+    lambda_module.userTable = resource.Table('Bolt_Hackathon_2025_Users')
+    lambda_module.userBidsTable = resource.Table('Bolt_Hackathon_2025_User_Bids')
+    lambda_module.modelStatsTable = resource.Table('Bolt_Hackathon_2025_Model_Stats')
+    lambda_module.settlementCheckpointTable = resource.Table('Bolt_Hackathon_2025_Settlement_Checkpoints')
+    # Stages hand off in-process instead of invoking the deployed function
+    lambda_module.pipeline_queue = InProcessQueue()
+    return resource
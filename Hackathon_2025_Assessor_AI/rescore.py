@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+# The lambda builds boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import lambda_function
+
+# Re-score settled Session_Results rows with the Assessor's scoring engine.
+#
+#   python rescore.py                       # metrics per model, live table
+#   python rescore.py --items export.json   # same, from a JSON export
+#   python rescore.py --write               # also backfill the metric columns
+#
+# --write only touches directionHit, absolutePercentError and brierScore;
+# accuracy, sessionStatus and payouts stay as they were settled.
+
+
+def load_items(path=None):
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    items = []
+    kwargs = {}
+    while True:
+        response = lambda_function.sessionResultsTable.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score settled predictions')
+    parser.add_argument('--items', help='JSON export of Session_Results instead of a table scan')
+    parser.add_argument('--write', action='store_true', help='backfill metric columns on the table')
+    args = parser.parse_args()
+
+    items = [item for item in load_items(args.items) if item.get('actualClose') is not None]
+    if not items:
+        raise SystemExit('No settled predictions found')
+
+    scores = lambda_function.score_predictions(
+        lambda_function.to_float_array(item.get('prediction') for item in items),
+        lambda_function.to_float_array(item.get('previousClose') for item in items),
+        lambda_function.to_float_array(item.get('actualClose') for item in items)
+    )
+
+    model_names = sorted({item['modelName'] for item in items})
+    model_index = np.array([model_names.index(item['modelName']) for item in items])
+
+    print(f"{'model':<26}{'settled':>8}{'win rate':>10}{'dir hit':>9}{'MAPE %':>9}{'Brier':>8}")
+    for m, model_name in enumerate(model_names):
+        mask = model_index == m
+        summary = lambda_function.summarize_scores({name: values[mask] for name, values in scores.items()})
+        print(f"{model_name:<26}{summary['settled']:>8}{summary['winRate']:>10.1%}"
+              f"{summary['directionHitRate']:>9.1%}{summary['mape']:>9.3f}{summary['brier']:>8.3f}")
+
+    if not args.write:
+        return
+
+    updates = [
+        {
+            'Key': {'candleTimestamp': item['candleTimestamp'], 'modelName': item['modelName']},
+            'UpdateExpression': 'SET directionHit = :directionHit, absolutePercentError = :ape, brierScore = :brier',
+            'ExpressionAttributeValues': {
+                ':directionHit': lambda_function.to_bool(scores['directionHit'][i], scores['directionValid'][i]),
+                ':ape': lambda_function.to_decimal(scores['absolutePercentError'][i]),
+                ':brier': lambda_function.to_decimal(scores['brierScore'][i])
+            }
+        }
+        for i, item in enumerate(items)
+    ]
+    lambda_function.write_concurrently(lambda_function.sessionResultsTable.update_item, updates)
+    print(f'\nBackfilled metrics on {len(updates)} rows')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import io
+import os
+import json
+from decimal import Decimal
+
+# The lambda builds boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+
+import lambda_function
+import local_tables
+
+# Drives predict -> persist -> settle -> payout against the in-memory tables
+# with an invocation budget that only fits a few bid pages at a time. The
+# first delivery of every stage message dies before saving its second
+# cursor, then the message is delivered twice more, the way an
+# at-least-once queue may.
+#
+#   python -m pytest test_pipeline.py
+
+candles_at = ['2025-06-01T00:00:00Z', '2025-06-01T00:05:00Z', '2025-06-01T00:10:00Z', '2025-06-01T00:15:00Z']
+bid_count = 23
+page_size = 4
+
+
+class FakeLambda:
+    # The prediction lambda and the blockchain service
+    def __init__(self):
+        self.predictions = []
+        self.transfers = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        payload = json.loads(Payload)
+        if FunctionName == 'Bolt_Hackathon_2025':
+            body = self.predictions.pop(0)
+        elif payload['method'] == 'send_to_users':
+            self.transfers.extend(json.loads(payload['body'])['transfers'])
+            body = {}
+        else:
+            raise Exception(f"Unexpected call {payload['method']}")
+        return {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': json.dumps(body)}).encode())}
+
+
+class Crash(Exception):
+    pass
+
+
+class Context:
+    # Each remaining-time check costs step_ms, so an invocation settles or
+    # pays a few pages and hands the rest to the next one
+    function_name = 'assessor'
+
+    def __init__(self, remaining_ms=100000, step_ms=30000):
+        self.remaining_ms = remaining_ms
+        self.step_ms = step_ms
+        self.first = True
+
+    def get_remaining_time_in_millis(self):
+        if self.first:
+            self.first = False
+        else:
+            self.remaining_ms -= self.step_ms
+        return self.remaining_ms
+
+
+def prediction(prediction_at, closes):
+    return {
+        'Answers': {'A': '100.00.', 'B': '102.00.'},
+        'PredictionCandleTimestamp': prediction_at,
+        'PreviousClose': '101.00',
+        'ActualData': json.dumps({'candles': [
+            {'timestamp': timestamp, 'close': close} for timestamp, close in closes
+        ]})
+    }
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    local_tables.install(lambda_function, local_tables.assessor_tables())
+    lambda_function.userBidsTable.page_size = page_size
+    fake_lambda = FakeLambda()
+    monkeypatch.setattr(lambda_function, 'lambda_client', fake_lambda)
+    monkeypatch.setattr(lambda_function, 'bid_shard_count', 0)
+
+    resume_keys = []
+    iter_round_bid_pages = lambda_function.iter_round_bid_pages
+
+    def recording_iter(round_id, start_key=None):
+        resume_keys.append(start_key)
+        return iter_round_bid_pages(round_id, start_key)
+
+    monkeypatch.setattr(lambda_function, 'iter_round_bid_pages', recording_iter)
+
+    # Armed for a delivery, the second cursor save raises: the page's
+    # writes are done but the checkpoint still points before it
+    saves = {'armed': False, 'count': 0, 'crashes': 0}
+    save_checkpoint = lambda_function.save_checkpoint
+
+    def crashing_save(round_id, cursor, key):
+        if saves['armed']:
+            saves['count'] += 1
+            if saves['count'] == 2:
+                saves['crashes'] += 1
+                raise Crash(f"{cursor} not saved")
+        save_checkpoint(round_id, cursor, key)
+
+    monkeypatch.setattr(lambda_function, 'save_checkpoint', crashing_save)
+    return fake_lambda, resume_keys, saves
+
+
+def deliver(queue, saves, max_messages=200):
+    delivered = []
+    while queue.messages:
+        # A stage that never makes progress keeps re-queueing itself
+        assert len(delivered) < max_messages
+        message = queue.messages.popleft()
+        for attempt in range(3):
+            saves.update(armed=attempt == 0, count=0)
+            try:
+                lambda_function.lambda_handler(json.loads(json.dumps(message)), Context())
+            except Crash:
+                pass
+        delivered.append(message['stage'])
+    saves['armed'] = False
+    return delivered
+
+
+def test_pipeline_redelivery_pays_every_winner_once(pipeline):
+    fake_lambda, resume_keys, saves = pipeline
+    queue = lambda_function.pipeline_queue
+
+    # Round for the 00:10 candle, predicted while 00:05 is still forming
+    fake_lambda.predictions.append(prediction(candles_at[2], [(candles_at[0], '101.00'), (candles_at[1], '101.00')]))
+    lambda_function.lambda_handler({}, Context())
+    # Nothing has closed yet, so settle finds nothing to do
+    assert set(deliver(queue, saves)) == {'persist', 'settle'}
+
+    round_id = lambda_function.round_id_for(candles_at[2])
+    for i in range(bid_count):
+        lambda_function.userTable.put_item(Item={'UserId': f'user-{i}', 'key': f'ADDR{i}'})
+        lambda_function.userBidsTable.put_item(Item={
+            'roundId': round_id,
+            'userId': f'user-{i}',
+            'bidAmount': Decimal(i + 1),
+            'prediction': 'A' if i % 3 else 'B',
+            'sessionStatus': 'OPEN',
+            'payoutAmount': 0
+        })
+
+    # The next round's run closes the 00:10 candle at 100, so A wins
+    fake_lambda.predictions.append(prediction(candles_at[3], [
+        (candles_at[1], '101.00'), (candles_at[2], '100.00'), (candles_at[3], '100.50')
+    ]))
+    lambda_function.lambda_handler({}, Context())
+    delivered = deliver(queue, saves)
+
+    # Both passes needed several invocations, and each picked up from the
+    # checkpoint's cursor
+    assert delivered.count('settle') > 2
+    assert delivered.count('payout') > 2
+    assert saves['crashes'] > 0
+    assert any(key is not None for key in resume_keys)
+
+    checkpoint = lambda_function.settlementCheckpointTable.get_item(Key={'roundId': round_id})['Item']
+    assert checkpoint['settlementStatus'] == 'DONE'
+    assert 'lastEvaluatedKey' not in checkpoint and 'payoutCursor' not in checkpoint
+    payout_ratio = checkpoint['winningModels']['A']
+    assert set(checkpoint['winningModels']) == {'A'}
+
+    bids = {item['userId']: item for item in lambda_function.userBidsTable.items.values()}
+    winners = {user_id for user_id, bid in bids.items() if bid['prediction'] == 'A'}
+    assert {user_id for user_id, bid in bids.items() if bid['sessionStatus'] == 'WIN'} == winners
+    assert all(bids[user_id]['payoutStatus'] == 'PAID' for user_id in winners)
+
+    # One transfer per winner, for exactly the settled amount
+    paid = {}
+    for transfer in fake_lambda.transfers:
+        assert transfer['toAddress'] not in paid
+        paid[transfer['toAddress']] = Decimal(str(transfer['amount']))
+    expected = {f"ADDR{user_id.split('-')[1]}": bids[user_id]['bidAmount'] * payout_ratio for user_id in winners}
+    assert paid.keys() == expected.keys()
+    for address, amount in expected.items():
+        assert paid[address] == pytest.approx(amount)
+
+    # Profile counters moved once per bid despite the crashes and redeliveries
+    for user_id, bid in bids.items():
+        user = lambda_function.userTable.get_item(Key={'UserId': user_id})['Item']
+        assert user.get('winCount', 0) + user.get('lossCount', 0) == 1
+        assert user['settledStaked'] == bid['bidAmount']
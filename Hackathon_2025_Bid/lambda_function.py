@@ -1,15 +1,58 @@
+import os
 import json
 import boto3
+import threading
+import time
 import uuid
+import zlib
 from datetime import datetime, timezone
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
   
 dynamodb = boto3.resource('dynamodb')
 userBidsTable = dynamodb.Table('Bolt_Hackathon_2025_User_Bids')
 userTable = dynamodb.Table('Bolt_Hackathon_2025_Users')
 sessionTable = dynamodb.Table('Bolt_Hackathon_2025_Sessions')
 lambda_client = boto3.client('lambda') 
+# Shared wallet balance cache read by the Users lambda; dropped here after
+# every transfer so a profile never shows the pre-bid balance for long
+balance_cache_table_name = os.environ.get("BALANCE_CACHE_TABLE")
+balance_cache_table = dynamodb.Table(balance_cache_table_name) if balance_cache_table_name else None
+
+# Escrow mode: bids debit the user's ledger balance (escrowBalance on the
+# user item) and the Assessor's collect stage moves the pending amounts on
+# chain in groups once the round closes, so no chain call sits in the request
+escrow_mode = os.environ.get("BID_ESCROW_MODE", "false") == "true"
+# Algorand minimum account balance plus the fee of the collection that moves
+# the stake; neither can be bid
+escrow_reserve = Decimal('0.1') + Decimal('0.001')
+
+# The user and round reads of a bid (or of a whole batch) go out together
+bid_executor = ThreadPoolExecutor(max_workers=8)
+serializer = TypeSerializer()
+
+# A batch is one transaction: a put per bid plus the user update
+max_batch_bids = 25
+
+# Write sharding for hot rounds: with BID_SHARD_COUNT > 0 every bid carries
+# roundShard = "<roundId>#<crc32(userId) % count>", indexed by
+# roundShard-userId-index in place of roundId-userId-index, so a round's
+# last-second bids spread over that many index partitions. The Assessor
+# must use the same count; only change it while no round is open.
+bid_shard_count = int(os.environ.get("BID_SHARD_COUNT", "0"))
+
+# Round items never change once the Assessor writes them, so a warm container
+# keeps them until the round closes (its candleTimestamp). Concurrent misses
+# for the same round share one read.
+round_cache_size = 512
+# For rounds whose close time can't be parsed
+round_cache_fallback_ttl_seconds = 60
+round_cache = OrderedDict()
+round_cache_lock = threading.Lock()
+round_loads = {}
 
 headers = {
     "Access-Control-Allow-Origin": "*",
@@ -26,31 +69,213 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(o)
 
 
-def insertBid(item):
-        # Put item in DynamoDB
-    userBidsTable.put_item(Item=item)
-
-    # Return success with created bid info
-    return {
-        "statusCode": 200,
-        "headers": headers,
-        "body": json.dumps({"message": "Bid created successfully"}, cls=DecimalEncoder)
+def insertBid(item, escrow=False):
+    try:
+        insertBids([item], escrow)
+    except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+        reasons = cancellationReasons(e)
+        if reasons and reasons[0] == 'ConditionalCheckFailed':
+            raise Exception(f"Already have an active bid for this session.")
+        if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+            if escrow:
+                raise Exception("Insufficient balance for this bid.")
+            raise Exception(f"User '{item['userId']}' not found")
+        raise
+
+
+def insertBids(items, escrow=False):
+    # One round trip: each bid put only succeeds if the user has no bid on
+    # that round yet (no check-then-write race), and the profile counters
+    # move with them. All of the bids go in or none do.
+    if not escrow:
+        # The chain debit comes after this write, so the bids wait as
+        # PENDING_DEBIT and settlement skips them until activateBids
+        items = [dict(item, sessionStatus='PENDING_DEBIT') for item in items]
+    count = len(items)
+    amount = sum(item['bidAmount'] for item in items)
+    user_update = {
+        'TableName': userTable.name,
+        'Key': serialize({'UserId': items[0]['userId']}),
+        'UpdateExpression': 'ADD betCount :one, totalStaked :amount',
+        'ConditionExpression': 'attribute_exists(UserId)',
+        'ExpressionAttributeValues': serialize({':one': count, ':amount': amount})
     }
+    if escrow:
+        # The ledger debit goes in the same transaction; escrowState puts the
+        # user on the collect stage's index without disturbing a collection
+        # already under way
+        user_update.update({
+            'UpdateExpression': 'SET escrowState = if_not_exists(escrowState, :pending) '
+                                'ADD betCount :one, totalStaked :amount, escrowBalance :debit, escrowPending :amount',
+            # :amount > :zero keeps a negative stake from crediting the ledger
+            'ConditionExpression': 'escrowBalance >= :amount AND :amount > :zero',
+            'ExpressionAttributeValues': serialize({
+                ':one': count, ':amount': amount, ':debit': -amount, ':pending': 'PENDING', ':zero': 0
+            })
+        })
+    dynamodb.meta.client.transact_write_items(TransactItems=[
+        {
+            'Put': {
+                'TableName': userBidsTable.name,
+                'Item': serialize(item),
+                'ConditionExpression': 'attribute_not_exists(userId)'
+            }
+        }
+        for item in items
+    ] + [
+        {
+            'Update': user_update
+        }
+    ])
+
+
+def cancellationReasons(e):
+    # One code per transaction item, in order
+    return [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+
+
+def syncEscrowBalance(user):
+    # Ledger balance = on-chain balance minus debits not collected yet and
+    # the reserve the collection needs. The escrowSyncedAt guard drops this
+    # write if a collection finished since the user was read, and no sync
+    # runs while a collection is in flight.
+    balance = getChainBalance(user.get("key"))
+    now = datetime.utcnow().isoformat()
+    if user.get('escrowSyncedAt'):
+        guard = 'escrowSyncedAt = :seen'
+        values = {':seen': user['escrowSyncedAt']}
+    else:
+        guard = 'attribute_not_exists(escrowSyncedAt)'
+        values = {}
+    values.update({':balance': Decimal(str(balance)) - escrow_reserve, ':zero': 0, ':now': now, ':collecting': 'COLLECTING'})
+    try:
+        userTable.update_item(
+            Key={'UserId': user['UserId']},
+            UpdateExpression='SET escrowBalance = :balance - if_not_exists(escrowPending, :zero), escrowSyncedAt = :now',
+            ConditionExpression=f'attribute_exists(UserId) AND {guard} AND '
+                                '(attribute_not_exists(escrowState) OR escrowState <> :collecting)',
+            ExpressionAttributeValues=values
+        )
+    except userTable.meta.client.exceptions.ConditionalCheckFailedException:
+        # Someone else synced first; the bid's own condition decides
+        pass
+
+
+def getChainBalance(address):
+    payload = {
+        "method": "balance",
+        "body": json.dumps({
+            "address": address
+        })
+    }
+    crypto_response = lambda_client.invoke(
+        FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
+        InvocationType='RequestResponse',
+        Payload=json.dumps(payload)
+    )
+    response_json = json.loads(crypto_response['Payload'].read())
+    body = json.loads(response_json.get("body"))
+
+    if response_json.get("statusCode") != 200:
+        raise Exception(f"Blockchain balance check failed: {body.get('error', 'Unknown error')}")
+
+    return body.get("balance")
+
+
+def activateBid(item):
+    activateBids([item])
+
+
+def activateBids(items):
+    # The debit went through: the bids become OPEN and settle with the round.
+    # One left PENDING_DEBIT after a debit never settles and is reconciled by hand.
+    dynamodb.meta.client.transact_write_items(TransactItems=[
+        {
+            'Update': {
+                'TableName': userBidsTable.name,
+                'Key': serialize({'userId': item['userId'], 'roundId': item['roundId']}),
+                'UpdateExpression': 'SET sessionStatus = :open',
+                'ConditionExpression': 'sessionStatus = :pending',
+                'ExpressionAttributeValues': serialize({':open': 'OPEN', ':pending': 'PENDING_DEBIT'})
+            }
+        }
+        for item in items
+    ])
+
+
+def removeBid(item):
+    removeBids([item])
+
+
+def removeBids(items):
+    # Undo insertBids when the on-chain debit fails
+    dynamodb.meta.client.transact_write_items(TransactItems=[
+        {
+            'Delete': {
+                'TableName': userBidsTable.name,
+                'Key': serialize({'userId': item['userId'], 'roundId': item['roundId']}),
+                'ConditionExpression': 'sessionStatus = :pending',
+                'ExpressionAttributeValues': serialize({':pending': 'PENDING_DEBIT'})
+            }
+        }
+        for item in items
+    ] + [
+        {
+            'Update': {
+                'TableName': userTable.name,
+                'Key': serialize({'UserId': items[0]['userId']}),
+                'UpdateExpression': 'ADD betCount :one, totalStaked :amount',
+                'ExpressionAttributeValues': serialize({
+                    ':one': -len(items), ':amount': -sum(item['bidAmount'] for item in items)
+                })
+            }
+        }
+    ])
+
+
+def serialize(values):
+    # transact_write_items only exists on the low-level client
+    return {name: serializer.serialize(value) for name, value in values.items()}
+
 
 def lambda_handler(event, context):
     try:
         user_id = event['requestContext']['authorizer']['userId']
         # Parse request body
         body = json.loads(event.get('body', '{}'))
+        if 'bids' in body:
+            return placeBids(user_id, body['bids'])
         round_id, bid_amount , prediction = validateInputs(body)
 
-        user = validateUser(user_id)
-        
-        item = prepareBid(user_id, round_id, bid_amount , prediction)
-
-        validateBalanceOnBlockChain(user,bid_amount)
-
-        return insertBid(item)
+        user_future = bid_executor.submit(validateUser, user_id)
+        round_future = bid_executor.submit(getCachedRound, round_id)
+        user = user_future.result()
+        session = round_future.result()
+
+        item = prepareBid(user_id, round_id, session, bid_amount , prediction)
+
+        if escrow_mode:
+            # Only an unknown or short ledger balance costs a chain read
+            if user.get('escrowBalance') is None or user['escrowBalance'] < item['bidAmount']:
+                syncEscrowBalance(user)
+            insertBid(item, escrow=True)
+        else:
+            # Claim the bid before moving funds, so a duplicate never pays twice
+            insertBid(item)
+
+            try:
+                validateBalanceOnBlockChain(user,bid_amount)
+            except Exception:
+                removeBid(item)
+                raise
+            activateBid(item)
+
+        # Return success with created bid info
+        return {
+            "statusCode": 200,
+            "headers": headers,
+            "body": json.dumps({"message": "Bid created successfully"}, cls=DecimalEncoder)
+        }
         
 
     except Exception as e:
@@ -61,6 +286,79 @@ def lambda_handler(event, context):
         }
 
 
+def placeBids(user_id, bids):
+    # {"bids": [{roundId, bidAmount, prediction}, ...]}: every bid is placed
+    # or none is, with one chain debit for the total
+    if not isinstance(bids, list) or not 0 < len(bids) <= max_batch_bids:
+        raise Exception(f"bids must contain 1 to {max_batch_bids} entries")
+
+    round_ids = {bid.get('roundId') for bid in bids if isinstance(bid, dict) and bid.get('roundId')}
+    user_future = bid_executor.submit(validateUser, user_id)
+    # Mostly cache hits; misses are read in parallel
+    round_futures = {round_id: bid_executor.submit(getCachedRound, round_id) for round_id in round_ids}
+    user = user_future.result()
+
+    items = []
+    results = []
+    for bid in bids:
+        round_id = bid.get('roundId') if isinstance(bid, dict) else None
+        try:
+            inputs = validateInputs(bid) if isinstance(bid, dict) else None
+            if not isinstance(inputs, tuple):
+                raise Exception("Missing required fields: roundId, bidAmount, prediction")
+            round_id, bid_amount, prediction = inputs
+            if any(item['roundId'] == round_id for item in items):
+                raise Exception("Duplicate roundId in this batch.")
+            items.append(prepareBid(user_id, round_id, round_futures[round_id].result(), bid_amount, prediction))
+            results.append({"roundId": round_id, "status": "CREATED"})
+        except Exception as e:
+            results.append({"roundId": round_id, "status": "REJECTED", "error": str(e)})
+
+    if len(items) < len(bids):
+        return batchResponse(400, "No bids were placed.", results)
+
+    total = sum(item['bidAmount'] for item in items)
+    try:
+        if escrow_mode:
+            if user.get('escrowBalance') is None or user['escrowBalance'] < total:
+                syncEscrowBalance(user)
+        insertBids(items, escrow=escrow_mode)
+    except dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+        reasons = cancellationReasons(e)
+        for result, reason in zip(results, reasons):
+            if reason == 'ConditionalCheckFailed':
+                result.update({"status": "REJECTED", "error": "Already have an active bid for this session."})
+        if len(reasons) > len(items) and reasons[len(items)] == 'ConditionalCheckFailed':
+            return batchResponse(400, "Insufficient balance for these bids." if escrow_mode else f"User '{user_id}' not found", results)
+        return batchResponse(409, "No bids were placed.", results)
+
+    if not escrow_mode:
+        try:
+            validateBalanceOnBlockChain(user, float(total))
+        except Exception as e:
+            removeBids(items)
+            return batchResponse(500, str(e), results)
+        activateBids(items)
+
+    return {
+        "statusCode": 200,
+        "headers": headers,
+        "body": json.dumps({"message": "Bids created successfully", "results": results}, cls=DecimalEncoder)
+    }
+
+
+def batchResponse(status_code, error, results):
+    # Nothing was written, whatever an individual bid's own status says
+    for result in results:
+        if result["status"] == "CREATED":
+            result["status"] = "NOT_PLACED"
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": json.dumps({"error": error, "results": results})
+    }
+
+
 def validateBalanceOnBlockChain(user,bid_amount):
 
     payload = {
@@ -82,11 +380,24 @@ def validateBalanceOnBlockChain(user,bid_amount):
     status_code = response_json.get("statusCode")
     body = json.loads(response_json.get("body"))
 
+    # Sent or not, the cached balance can't be trusted any more
+    invalidateBalanceCache(user.get("key"))
+
     if status_code != 200:
         raise Exception(f"Blockchain balance check failed: {body.get('error', 'Unknown error')}")
 
 
-def prepareBid(user_id, round_id, bid_amount , prediction):
+def invalidateBalanceCache(address):
+    if balance_cache_table is None or not address:
+        return
+    try:
+        balance_cache_table.delete_item(Key={"address": address})
+    except Exception as e:
+        # The entry expires on its own shortly
+        print("Balance cache invalidation failed : ", e)
+
+
+def getRound(round_id):
 
     # response = sessionTable.query(
     #     KeyConditionExpression=Key('roundId').eq(round_id)
@@ -98,15 +409,64 @@ def prepareBid(user_id, round_id, bid_amount , prediction):
     )
 
     items = response.get('Items', [])
-    bid = items[0] if items else None
+    return items[0] if items else None
+
+
+def getCachedRound(round_id):
+    now = time.time()
+    with round_cache_lock:
+        entry = round_cache.get(round_id)
+        if entry and entry[1] > now:
+            round_cache.move_to_end(round_id)
+            return entry[0]
+        load = round_loads.get(round_id)
+        leader = load is None
+        if leader:
+            load = round_loads[round_id] = Future()
+
+    if not leader:
+        # Someone else is already reading this round
+        return load.result()
+
+    try:
+        session = getRound(round_id)
+    except Exception as e:
+        with round_cache_lock:
+            round_loads.pop(round_id, None)
+        load.set_exception(e)
+        raise
+
+    expires_at = roundCloseTime(session, now) if session else now
+    with round_cache_lock:
+        # Unknown rounds aren't cached (they may be about to open), nor are
+        # closed ones
+        if expires_at > now:
+            round_cache[round_id] = (session, expires_at)
+            round_cache.move_to_end(round_id)
+            while len(round_cache) > round_cache_size:
+                round_cache.popitem(last=False)
+        round_loads.pop(round_id, None)
+    load.set_result(session)
+    return session
+
+
+def roundCloseTime(session, now):
+    try:
+        close_time = datetime.fromisoformat(session.get('candleTimestamp'))
+    except (TypeError, ValueError):
+        return now + round_cache_fallback_ttl_seconds
+    if close_time.tzinfo is None:
+        close_time = close_time.replace(tzinfo=timezone.utc)
+    return close_time.timestamp()
+
+
+def prepareBid(user_id, round_id, bid, bid_amount , prediction):
+
     now = datetime.now(timezone.utc)
     if not bid: 
         raise Exception(f"Session is not found.")
 
-    response = userBidsTable.query(KeyConditionExpression=Key('userId').eq(user_id) & Key('roundId').eq(round_id))
-
-    if response.get('Items'):
-        raise Exception(f"Already have an active bid for this session.")
+    # Duplicate bids are rejected by insertBid's conditional put
 
         # Parse the stored time from bid
     start_time_str = bid.get('candleTimestamp')  # or whatever the field is
@@ -116,7 +476,7 @@ def prepareBid(user_id, round_id, bid_amount , prediction):
         raise Exception(f"Session has ended.")
 
     # Prepare item to put in DynamoDB
-    return {
+    item = {
         'roundId': round_id,
         'userId': user_id,
         'bidAmount': Decimal(str(bid_amount)),
@@ -125,6 +485,15 @@ def prepareBid(user_id, round_id, bid_amount , prediction):
         'sessionStatus': 'OPEN',
         'payoutAmount': 0
     }
+    if bid_shard_count > 0:
+        item['roundShard'] = roundShardKey(round_id, user_id)
+    return item
+
+
+def roundShardKey(round_id, user_id):
+    # crc32 rather than hash(): the same user lands on the same shard in
+    # every container
+    return f"{round_id}#{zlib.crc32(user_id.encode()) % bid_shard_count}"
 
 
 def validateInputs(body):
@@ -139,8 +508,21 @@ def validateInputs(body):
             "headers": headers,
             "body": json.dumps({"error": "Missing required fields: roundId, bidAmount, prediction"})
         }
+    validateBidAmount(bid_amount)
     return round_id, bid_amount, prediction
 
+
+def validateBidAmount(bid_amount):
+    # Checked before anything is summed or written: a negative bid would
+    # cancel out another one in a batch total
+    try:
+        amount = Decimal(str(bid_amount))
+    except ArithmeticError:
+        amount = None
+    # 1E125 is the top of DynamoDB's number range
+    if isinstance(bid_amount, bool) or amount is None or not amount.is_finite() or not 0 < amount < Decimal('1E125'):
+        raise Exception("bidAmount must be a positive number.")
+
 def validateUser(user_id):
     userObject = userTable.query(
         KeyConditionExpression=Key('UserId').eq(user_id)
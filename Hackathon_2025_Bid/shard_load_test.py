@@ -0,0 +1,118 @@
+import os
+import sys
+import heapq
+import random
+import argparse
+
+# The lambda builds boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import lambda_function
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Hackathon_2025_Assessor_AI'))
+import local_tables
+
+# Load test of one hot round's bid writes against the in-memory tables, with
+# DynamoDB's per-partition write limit switched on.
+#
+#   python shard_load_test.py
+#   python shard_load_test.py --bids 20000 --window 1 --shards 0,4,16,32
+#
+# Every user bids on the same round within --window seconds; throttled bids
+# retry with jittered backoff. Time is simulated, so runs are repeatable and
+# don't depend on the machine. Each partition starts with one second of
+# burst capacity, so the offered load has to outlast it to show anything.
+# Shard count 0 is the unsharded roundId-userId-index; N > 0 writes
+# roundShard-userId-index instead.
+
+round_id = 'load-test-round'
+max_backoff_seconds = 1.0
+base_backoff_seconds = 0.025
+
+
+def setup(shard_count, users, capacity, clock):
+    resource = local_tables.assessor_tables()
+    tables = resource.client.tables
+    user_bids = tables['Bolt_Hackathon_2025_User_Bids']
+    # Sharding only helps once the per-round index is gone
+    del user_bids.indexes['roundShard-userId-index' if shard_count == 0 else 'roundId-userId-index']
+
+    lambda_function.dynamodb = resource
+    lambda_function.userTable = tables['Bolt_Hackathon_2025_Users']
+    lambda_function.userBidsTable = user_bids
+    lambda_function.sessionTable = tables['Bolt_Hackathon_2025_Sessions']
+    lambda_function.bid_shard_count = shard_count
+
+    lambda_function.sessionTable.put_item(Item={'roundId': round_id, 'candleTimestamp': '2999-01-01T00:00:00+00:00'})
+    for i in range(users):
+        lambda_function.userTable.put_item(Item={'UserId': f'user-{i}'})
+
+    for table in tables.values():
+        table.partition_write_capacity = capacity
+        table.clock = lambda: clock[0]
+    return user_bids
+
+
+def is_throttled(error):
+    response = getattr(error, 'response', {})
+    codes = [response.get('Error', {}).get('Code')]
+    codes += [reason.get('Code') for reason in response.get('CancellationReasons', [])]
+    return 'ThrottlingError' in codes or 'ProvisionedThroughputExceededException' in codes
+
+
+def run(shard_count, bids, window, capacity, seed):
+    clock = [0.0]
+    user_bids = setup(shard_count, bids, capacity, clock)
+    session = lambda_function.getRound(round_id)
+    rng = random.Random(seed)
+
+    # (time, user, attempt, arrival)
+    events = [(window * i / bids, i, 0, window * i / bids) for i in range(bids)]
+    heapq.heapify(events)
+    latencies = []
+    attempts = 0
+    while events:
+        now, user, attempt, arrival = heapq.heappop(events)
+        clock[0] = now
+        attempts += 1
+        item = lambda_function.prepareBid(f'user-{user}', round_id, session, 1, 'UP')
+        try:
+            lambda_function.insertBid(item)
+            latencies.append(now - arrival)
+        except Exception as e:
+            if not is_throttled(e):
+                raise
+            delay = min(max_backoff_seconds, base_backoff_seconds * 2 ** attempt) * rng.uniform(0.5, 1.0)
+            heapq.heappush(events, (now + delay, user, attempt + 1, arrival))
+
+    if len(user_bids.items) != bids:
+        raise Exception(f"Expected {bids} bids, stored {len(user_bids.items)}")
+    latencies.sort()
+    return {
+        'seconds': clock[0],
+        'throughput': bids / clock[0] if clock[0] else float('inf'),
+        'attempts': attempts,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bid write throughput per round by shard count')
+    parser.add_argument('--bids', type=int, default=10000, help='users bidding on the round')
+    parser.add_argument('--window', type=float, default=0.5, help='seconds over which the bids arrive')
+    parser.add_argument('--capacity', type=int, default=1000, help='writes per second per partition')
+    parser.add_argument('--shards', default='0,2,4,8,16', help='comma-separated shard counts')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f'{args.bids} bids over {args.window}s, {args.capacity} writes/s per partition\n')
+    print(f"{'shards':>6}{'bids/s':>10}{'seconds':>9}{'attempts':>10}{'p50 s':>8}{'p99 s':>8}")
+    for shard_count in [int(value) for value in args.shards.split(',')]:
+        result = run(shard_count, args.bids, args.window, args.capacity, args.seed)
+        print(f"{shard_count:>6}{result['throughput']:>10.0f}{result['seconds']:>9.2f}{result['attempts']:>10}"
+              f"{result['p50']:>8.2f}{result['p99']:>8.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,31 @@ export async function checkBalance(address) {
   }
 }
 
+// Balances for several addresses in one call; lookups run a few at a time
+// so a large batch doesn't trip the node's rate limit
+export const MAX_BALANCE_BATCH = 100;
+const BALANCE_CONCURRENCY = 10;
+
+export async function checkBalances(addresses) {
+  const balances = {};
+  const queue = [...new Set(addresses)];
+
+  const worker = async () => {
+    while (queue.length > 0) {
+      const address = queue.shift();
+      try {
+        balances[address] = await checkBalance(address);
+      } catch (err) {
+        // One bad address doesn't fail the batch
+        balances[address] = null;
+      }
+    }
+  };
+
+  await Promise.all(Array.from({ length: Math.min(BALANCE_CONCURRENCY, queue.length) }, worker));
+  return balances;
+}
+
 export async function createTestWallet() {
   const account = algosdk.generateAccount();
   const mnemonic = algosdk.secretKeyToMnemonic(account.sk);
@@ -97,3 +122,157 @@ export async function sendAlgo({ fromMnemonic, toAddress, amount }) {
     throw err;
   }
 }
+
+// Algorand caps an atomic transaction group at 16 transactions
+export const MAX_GROUP_SIZE = 16;
+
+// Marks an error as "nothing reached the chain", so the caller can safely
+// retry; rejectedIndex is the transfer algod named, when it named one
+function notSubmitted(err, txns) {
+  err.submitted = false;
+  const message = String(err.response?.body?.message ?? err.message);
+  const match = /transaction ([A-Z2-7]{52})/.exec(message);
+  if (match && txns) {
+    const index = txns.findIndex((txn) => txn.txID() === match[1]);
+    if (index >= 0) {
+      err.rejectedIndex = index;
+    }
+  }
+  return err;
+}
+
+// Until the group is handed to algod nothing can have landed; a 400 from
+// algod is a rejection. Anything later (timeouts, confirmation) is unknown.
+function tagSubmission(err, stage, txns) {
+  if (stage === "build" || (stage === "send" && err.response?.status === 400)) {
+    return notSubmitted(err, txns);
+  }
+  err.submitted = true;
+  return err;
+}
+
+export async function sendAlgoGroup({ fromMnemonic, transfers }) {
+  let stage = "build";
+  let txns = null;
+  try {
+
+    if (!fromMnemonic) {
+      throw new Error("fromMnemonic is required");
+    }
+
+    if (!Array.isArray(transfers) || transfers.length === 0 || transfers.length > MAX_GROUP_SIZE) {
+      throw new Error(`transfers must contain 1 to ${MAX_GROUP_SIZE} entries`);
+    }
+
+    const sender = algosdk.mnemonicToSecretKey(fromMnemonic);
+
+    if (!sender.addr) {
+      throw new Error("Invalid fromMnemonic - failed to derive sender address");
+    }
+
+    // One params fetch for the whole group
+    const params = await algodClient.getTransactionParams().do();
+
+    txns = transfers.map(({ toAddress, amount }) => {
+      if (typeof toAddress !== "string" || toAddress.trim() === "") {
+        throw new Error("Invalid toAddress");
+      }
+      return algosdk.makePaymentTxnWithSuggestedParamsFromObject({
+        sender: `${sender.addr}`,
+        receiver: toAddress,
+        amount: Math.round(amount * 1e6),
+        suggestedParams: params,
+      });
+    });
+
+    // All transfers in the group commit together or not at all
+    algosdk.assignGroupID(txns);
+    const signedTxns = txns.map((txn) => txn.signTxn(sender.sk));
+
+    stage = "send";
+    const txResponse = await algodClient.sendRawTransaction(signedTxns).do();
+    stage = "confirm";
+
+    console.log("Group send response:", txResponse);
+
+    const txId = txResponse.txid;
+    if (!txId) {
+      throw new Error("No transaction ID returned from algod");
+    }
+
+    const confirmedTxn = await algosdk.waitForConfirmation(algodClient, txId, 4);
+
+    console.log("✅ Group confirmed in round", confirmedTxn["confirmed-round"]);
+
+    return {
+      txIds: txns.map((txn) => txn.txID()),
+      round: confirmedTxn["confirmed-round"],
+    };
+  } catch (err) {
+    console.error("❌ Error sending Algo group:", err);
+    throw tagSubmission(err, stage, txns);
+  }
+}
+
+// Escrow collection: one transfer per user to the same receiver, each signed
+// by its own sender, committed together as one atomic group
+export async function collectAlgoGroup({ toAddress, collections }) {
+  let stage = "build";
+  let txns = null;
+  try {
+
+    if (typeof toAddress !== "string" || toAddress.trim() === "") {
+      throw new Error("Invalid toAddress");
+    }
+
+    if (!Array.isArray(collections) || collections.length === 0 || collections.length > MAX_GROUP_SIZE) {
+      throw new Error(`collections must contain 1 to ${MAX_GROUP_SIZE} entries`);
+    }
+
+    const senders = collections.map(({ fromMnemonic }) => {
+      const sender = algosdk.mnemonicToSecretKey(fromMnemonic);
+      if (!sender.addr) {
+        throw new Error("Invalid fromMnemonic - failed to derive sender address");
+      }
+      return sender;
+    });
+
+    // One params fetch for the whole group
+    const params = await algodClient.getTransactionParams().do();
+
+    txns = collections.map(({ amount }, i) =>
+      algosdk.makePaymentTxnWithSuggestedParamsFromObject({
+        sender: `${senders[i].addr}`,
+        receiver: toAddress,
+        amount: Math.round(amount * 1e6),
+        suggestedParams: params,
+      })
+    );
+
+    algosdk.assignGroupID(txns);
+    const signedTxns = txns.map((txn, i) => txn.signTxn(senders[i].sk));
+
+    stage = "send";
+    const txResponse = await algodClient.sendRawTransaction(signedTxns).do();
+    stage = "confirm";
+
+    console.log("Collection group send response:", txResponse);
+
+    const txId = txResponse.txid;
+    if (!txId) {
+      throw new Error("No transaction ID returned from algod");
+    }
+
+    const confirmedTxn = await algosdk.waitForConfirmation(algodClient, txId, 4);
+
+    console.log("✅ Collection group confirmed in round", confirmedTxn["confirmed-round"]);
+
+    return {
+      txIds: txns.map((txn) => txn.txID()),
+      round: confirmedTxn["confirmed-round"],
+    };
+  } catch (err) {
+    console.error("❌ Error collecting Algo group:", err);
+    throw tagSubmission(err, stage, txns);
+  }
+}
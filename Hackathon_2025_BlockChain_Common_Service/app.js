@@ -1,6 +1,6 @@
 import * as pkg from "./algorandUtils.js";
 
-const { checkBalance, createTestWallet, sendAlgo } = pkg;
+const { checkBalance, checkBalances, collectAlgoGroup, createTestWallet, sendAlgo, sendAlgoGroup, MAX_GROUP_SIZE, MAX_BALANCE_BATCH } = pkg;
 
 const HOUSE_KEYS = process.env.HOUSE_KEYS;
 const HOUSE_MNEMONIC = process.env.HOUSE_MNEMONIC;
@@ -48,6 +48,28 @@ export const handler = async (event) => {
       };
     }
 
+    if (method === "balances") {
+      const { addresses } = body;
+
+      const valid =
+        Array.isArray(addresses) &&
+        addresses.length > 0 &&
+        addresses.length <= MAX_BALANCE_BATCH &&
+        addresses.every((address) => address && typeof address === "string");
+
+      if (!valid) {
+        return {
+          statusCode: 400,
+          body: JSON.stringify({ error: `addresses must be 1 to ${MAX_BALANCE_BATCH} address strings` }),
+        };
+      }
+      const balances = await checkBalances(addresses);
+      return {
+        statusCode: 200,
+        body: JSON.stringify({ balances }),
+      };
+    }
+
     if (method === "create-wallet") {
       const testWallet = await createTestWallet();
       return {
@@ -94,6 +116,50 @@ export const handler = async (event) => {
       };
     }
 
+    if (method === "send_to_users") {
+      const { transfers } = body;
+
+      const valid =
+        Array.isArray(transfers) &&
+        transfers.length > 0 &&
+        transfers.length <= MAX_GROUP_SIZE &&
+        transfers.every(({ toAddress, amount }) => toAddress && !isNaN(Number(amount)));
+
+      if (!valid) {
+        return {
+          statusCode: 400,
+          body: JSON.stringify({ error: `transfers must be 1 to ${MAX_GROUP_SIZE} { toAddress, amount } entries` }),
+        };
+      }
+      const result = await sendAlgoGroup({ fromMnemonic:HOUSE_MNEMONIC, transfers });
+      return {
+        statusCode: 200,
+        body: JSON.stringify(result),
+      };
+    }
+
+    if (method === "collect_from_users") {
+      const { collections } = body;
+
+      const valid =
+        Array.isArray(collections) &&
+        collections.length > 0 &&
+        collections.length <= MAX_GROUP_SIZE &&
+        collections.every(({ fromMnemonic, amount }) => fromMnemonic && !isNaN(Number(amount)));
+
+      if (!valid) {
+        return {
+          statusCode: 400,
+          body: JSON.stringify({ error: `collections must be 1 to ${MAX_GROUP_SIZE} { fromMnemonic, amount } entries` }),
+        };
+      }
+      const result = await collectAlgoGroup({ toAddress:HOUSE_KEYS, collections });
+      return {
+        statusCode: 200,
+        body: JSON.stringify(result),
+      };
+    }
+
     // If no matching route
     return {
       statusCode: 404,
@@ -105,6 +171,9 @@ export const handler = async (event) => {
       body: JSON.stringify({
         error: err.message,
         details: err.message,
+        // Group methods: false when nothing reached the chain (safe to retry)
+        submitted: err.submitted !== false,
+        rejectedIndex: err.rejectedIndex,
       }),
     };
   }
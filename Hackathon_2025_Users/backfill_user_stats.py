@@ -0,0 +1,82 @@
+import os
+import sys
+import argparse
+from decimal import Decimal
+
+# The lambda builds boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import lambda_function
+
+# One-off seed of the per-user profile counters (betCount, winCount,
+# lossCount, totalStaked, settledStaked, totalPayout) from User_Bids.
+#
+#   python backfill_user_stats.py            # print what would be written
+#   python backfill_user_stats.py --write    # write the counters
+#
+# Counters are SET, not added, so re-running it recomputes them. Run it after
+# the Bid lambda and the Assessor are updating the counters, while no round
+# is settling: a bid placed or settled during the scan can be off by one.
+
+user_bids_table_name = 'Bolt_Hackathon_2025_User_Bids'
+counter_names = ['betCount', 'winCount', 'lossCount', 'totalStaked', 'settledStaked', 'totalPayout']
+
+
+def scan_bids():
+    table = lambda_function.dynamodb.Table(user_bids_table_name)
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def aggregate(bids):
+    stats = {}
+    for bid in bids:
+        user = stats.setdefault(bid['userId'], dict.fromkeys(counter_names, Decimal('0')))
+        amount = Decimal(bid['bidAmount'])
+        user['betCount'] += 1
+        user['totalStaked'] += amount
+        if bid.get('sessionStatus') == 'WIN':
+            user['winCount'] += 1
+            user['settledStaked'] += amount
+            user['totalPayout'] += Decimal(bid.get('payoutAmount', 0))
+        elif bid.get('sessionStatus') == 'LOSE':
+            user['lossCount'] += 1
+            user['settledStaked'] += amount
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed per-user profile counters from User_Bids')
+    parser.add_argument('--write', action='store_true', help='write the counters to the Users table')
+    args = parser.parse_args()
+
+    stats = aggregate(scan_bids())
+    print(f'{len(stats)} users with bids')
+
+    missing = 0
+    for user_id, user in stats.items():
+        if not args.write:
+            print(user_id, {name: str(value) for name, value in user.items()})
+            continue
+        try:
+            lambda_function.userTable.update_item(
+                Key={'UserId': user_id},
+                UpdateExpression='SET ' + ', '.join(f'{name} = :{name}' for name in counter_names),
+                # Bids of deleted users are skipped rather than recreating them
+                ConditionExpression='attribute_exists(UserId)',
+                ExpressionAttributeValues={f':{name}': value for name, value in user.items()}
+            )
+        except lambda_function.userTable.meta.client.exceptions.ConditionalCheckFailedException:
+            missing += 1
+
+    if args.write:
+        print(f'Seeded {len(stats) - missing} users, skipped {missing} unknown users')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
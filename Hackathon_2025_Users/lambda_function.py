@@ -1,17 +1,50 @@
+import os
 import json
 import boto3
+import random
+import threading
+import time
 from decimal import Decimal
 import json
 from boto3.dynamodb.conditions import Key, Attr
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
  
 # Initialize DynamoDB resource and table
 dynamodb = boto3.resource('dynamodb')
 userTable = dynamodb.Table('Bolt_Hackathon_2025_Users')
 lambda_client = boto3.client('lambda') 
-userBidsTable = dynamodb.Table('Bolt_Hackathon_2025_User_Bids')
 sessionResultsTable = dynamodb.Table('Bolt_Hackathon_2025_Session_Results')
+# Maintained by the Assessor at settlement: counters + recent0..recent9 per model
+model_stats_table_name = 'Bolt_Hackathon_2025_Model_Stats'
+model_stats_ring_size = 10
 unqiue_models = ['Command Light','Jamba 1.5 Mini','Nova Lite']
 
+# Independent reads of a profile request run side by side; a dependency that
+# fails or is slower than its timeout leaves its field null instead of
+# failing the whole profile
+profile_executor = ThreadPoolExecutor(max_workers=8)
+# get_model_win_rates already runs on profile_executor; its fallback queries
+# get their own pool so they can never wait on a slot held by their caller
+win_rate_fallback_executor = ThreadPoolExecutor(max_workers=len(unqiue_models))
+balance_timeout_seconds = 3
+model_stats_timeout_seconds = 2
+
+# Wallet balances by address. The shared DynamoDB tier (partition key
+# "address", TTL attribute "expiresAt") is deleted by the Bid lambda and the
+# Assessor whenever they move funds; the per-container tier can't be reached
+# from there, so it only lives a few seconds
+balance_cache_size = 1024
+balance_cache_ttl_seconds = 5
+balance_cache = OrderedDict()
+balance_cache_lock = threading.Lock()
+balance_cache_table_name = os.environ.get("BALANCE_CACHE_TABLE")
+balance_cache_table = dynamodb.Table(balance_cache_table_name) if balance_cache_table_name else None
+shared_balance_cache_ttl_seconds = 60
+
+# Most profiles one batch request may ask for (one batch_get_item page)
+max_batch_profiles = 100
+
 headers = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
@@ -25,6 +58,10 @@ def lambda_handler(event, context):
         # Get query parameters (for GET requests)
         query_params = event.get('queryStringParameters') or {}
 
+        user_ids = get_requested_user_ids(event, query_params)
+        if user_ids is not None:
+            return get_profiles(user_ids)
+
         userId = query_params.get('userId')
         
         if not userId:
@@ -34,6 +71,9 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "Missing userId in request body"})
             }
 
+        # Model win rates don't depend on the user, start them first
+        win_rates_future = profile_executor.submit(get_model_win_rates, unqiue_models)
+
         # Step 2: Query DynamoDB with the given userId
         response = userTable.get_item(
             Key={'UserId': userId}
@@ -47,83 +87,15 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": "User not found"})
             }
 
+        balance_future = profile_executor.submit(get_cached_balance, item.get("key"))
 
-        payload = {
-            "method": "balance",
-            "body": json.dumps({
-                "address": item.get("key") 
-            })
-        }
-
-        crypto_response = lambda_client.invoke(
-            FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
-            InvocationType='RequestResponse',  
-            Payload=json.dumps(payload)
-        )
-
-        raw_payload = crypto_response['Payload'].read()
-        decoded_payload = json.loads(raw_payload)
-
-
-        body_str = decoded_payload.get("body")  # Still a string
-
-        # Step 2: Parse the inner JSON string
-        body_dict = json.loads(body_str)
-
-        # Step 3: Now extract balance
-        balance = body_dict.get("balance")
-
-        response = userBidsTable.query(
-            IndexName='userId-index',  # 🔁 Replace with your GSI name
-            KeyConditionExpression=Key('userId').eq(userId)
-        )
-
-        loseCount = 0
-        winCount = 0
-
-        totalEarning = 0
-        totalBets= 0 
-        print(response['Items'])
-        for bids in response['Items']:
-            totalBets += 1
-            if bids['sessionStatus'] == 'LOSE':
-                totalEarning -= bids['bidAmount']
-                loseCount += 1
-            elif bids['sessionStatus'] == 'WIN':
-                winCount += 1
-                totalEarning -= bids['bidAmount']
-                totalEarning += bids['payoutAmount']
-
-
-        total = winCount + loseCount
-
-        if total == 0:
-            winRate = 0.0
-        else:
-            winRate = (winCount / total) * 100
-
-        modelWinRates = []
-
-        for model in unqiue_models:
-            modelWinRates.append({
-                'modelName': model,
-                'winRate': getAverageAccuracy(model) * 100
-            })
-
-        filtered_user = {
-            "userId": item.get("UserId"),
-            "username": item.get("username"),
-            "balance": balance,
-            "winRate": winRate,
-            "totalBets": totalBets,
-            "totalEarning": totalEarning,
-            "modelWinRates": modelWinRates
-        }
+        balance = result_or_none(balance_future, balance_timeout_seconds, "balance")
+        win_rates = result_or_none(win_rates_future, model_stats_timeout_seconds, "modelWinRates")
 
         return {
             "statusCode": 200,
             "headers": headers,
-            "body": json.dumps({"user": filtered_user}, cls=DecimalEncoder)
+            "body": json.dumps({"user": build_profile(item, balance, win_rates)}, cls=DecimalEncoder)
         }
 
     except Exception as e:
@@ -134,6 +106,239 @@ def lambda_handler(event, context):
         }
 
 
+def get_requested_user_ids(event, query_params):
+    # Batch requests: ?userIds=a,b,c or a JSON body {"userIds": [...]}
+    if query_params.get('userIds'):
+        return [user_id for user_id in query_params['userIds'].split(',') if user_id]
+    body = event.get('body')
+    if body:
+        try:
+            body = json.loads(body) if isinstance(body, str) else body
+        except ValueError:
+            return None
+        if isinstance(body, dict) and 'userIds' in body:
+            return body['userIds']
+    return None
+
+
+def get_profiles(user_ids):
+    # Leaderboard-style batch: one batch read for the users, one blockchain
+    # call for the balances and one model win-rate read shared by everyone
+    if (not isinstance(user_ids, list) or not 0 < len(user_ids) <= max_batch_profiles
+            or not all(isinstance(user_id, str) and user_id for user_id in user_ids)):
+        return {
+            "statusCode": 400,
+            "headers": headers,
+            "body": json.dumps({"error": f"userIds must be 1 to {max_batch_profiles} user ids"})
+        }
+
+    win_rates_future = profile_executor.submit(get_model_win_rates, unqiue_models)
+
+    user_ids = list(dict.fromkeys(user_ids))
+    users = {
+        item['UserId']: item
+        for item in batch_get_all(userTable.name, [{'UserId': user_id} for user_id in user_ids])
+    }
+
+    addresses = [item['key'] for item in users.values() if item.get('key')]
+    balances_future = profile_executor.submit(get_cached_balances, addresses)
+
+    balances = result_or_none(balances_future, balance_timeout_seconds, "balance") or {}
+    win_rates = result_or_none(win_rates_future, model_stats_timeout_seconds, "modelWinRates")
+
+    return {
+        "statusCode": 200,
+        "headers": headers,
+        "body": json.dumps({
+            # Same order as requested
+            "users": [
+                build_profile(users[user_id], balances.get(users[user_id].get('key')), win_rates)
+                for user_id in user_ids if user_id in users
+            ],
+            "notFound": [user_id for user_id in user_ids if user_id not in users]
+        }, cls=DecimalEncoder)
+    }
+
+
+def build_profile(item, balance, win_rates):
+    # Counters kept on the user item by the Bid lambda and the Assessor,
+    # seeded for existing users by backfill_user_stats.py
+    totalBets = item.get('betCount', 0)
+    winCount = item.get('winCount', 0)
+    loseCount = item.get('lossCount', 0)
+    # Settled bids only, like before: open bids are neither lost nor won yet
+    totalEarning = item.get('totalPayout', 0) - item.get('settledStaked', 0)
+
+    total = winCount + loseCount
+
+    if total == 0:
+        winRate = 0.0
+    else:
+        winRate = (winCount / total) * 100
+
+    modelWinRates = [
+        {
+            'modelName': model,
+            'winRate': win_rates[model] * 100
+        }
+        for model in unqiue_models
+    ] if win_rates is not None else None
+
+    return {
+        "userId": item.get("UserId"),
+        "username": item.get("username"),
+        "balance": balance,
+        "winRate": winRate,
+        "totalBets": totalBets,
+        "totalEarning": totalEarning,
+        "modelWinRates": modelWinRates
+    }
+
+
+def get_balance(address):
+    payload = {
+        "method": "balance",
+        "body": json.dumps({
+            "address": address
+        })
+    }
+
+    crypto_response = lambda_client.invoke(
+        FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
+        InvocationType='RequestResponse',  
+        Payload=json.dumps(payload)
+    )
+
+    raw_payload = crypto_response['Payload'].read()
+    decoded_payload = json.loads(raw_payload)
+
+
+    body_str = decoded_payload.get("body")  # Still a string
+
+    # Parse the inner JSON string
+    body_dict = json.loads(body_str)
+
+    # Now extract balance
+    return body_dict.get("balance")
+
+
+def get_balances(addresses):
+    payload = {
+        "method": "balances",
+        "body": json.dumps({
+            "addresses": addresses
+        })
+    }
+
+    crypto_response = lambda_client.invoke(
+        FunctionName='Bolt_Hackathon_2025_BlockChain_Common_Service',
+        InvocationType='RequestResponse',
+        Payload=json.dumps(payload)
+    )
+    response_json = json.loads(crypto_response['Payload'].read())
+    body = json.loads(response_json.get("body"))
+
+    if response_json.get("statusCode") != 200:
+        raise Exception(f"Blockchain balances failed: {body.get('error', 'Unknown error')}")
+
+    # null for addresses the node couldn't look up
+    return body.get("balances", {})
+
+
+def get_cached_balance(address):
+    return get_cached_balances([address]).get(address)
+
+
+def get_cached_balances(addresses):
+    now = time.time()
+    balances = {}
+    with balance_cache_lock:
+        for address in addresses:
+            entry = balance_cache.get(address)
+            if entry and entry[1] > now:
+                balance_cache.move_to_end(address)
+                balances[address] = entry[0]
+
+    missing = [address for address in dict.fromkeys(addresses) if address not in balances]
+    if missing and balance_cache_table is not None:
+        try:
+            items = batch_get_all(balance_cache_table.name, [{"address": address} for address in missing])
+            # DynamoDB TTL deletes lazily, so check expiry ourselves
+            balances.update((item["address"], item["balance"]) for item in items if item.get("expiresAt", 0) > now)
+        except Exception as e:
+            print("Balance cache read failed : ", e)
+
+    to_fetch = [address for address in missing if address not in balances]
+    if to_fetch:
+        # A single profile keeps using the plain balance call
+        fetched = {to_fetch[0]: get_balance(to_fetch[0])} if len(to_fetch) == 1 else get_balances(to_fetch)
+        fetched = {address: balance for address, balance in fetched.items() if balance is not None}
+        balances.update(fetched)
+        if balance_cache_table is not None and fetched:
+            try:
+                with balance_cache_table.batch_writer() as batch:
+                    for address, balance in fetched.items():
+                        batch.put_item(Item={
+                            "address": address,
+                            "balance": Decimal(str(balance)),
+                            "expiresAt": int(now + shared_balance_cache_ttl_seconds)
+                        })
+            except Exception as e:
+                print("Balance cache write failed : ", e)
+
+    with balance_cache_lock:
+        for address in missing:
+            if address in balances:
+                balance_cache[address] = (balances[address], now + balance_cache_ttl_seconds)
+                balance_cache.move_to_end(address)
+        while len(balance_cache) > balance_cache_size:
+            balance_cache.popitem(last=False)
+
+    return balances
+
+
+def result_or_none(future, timeout, field):
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        # Timed out or failed: the profile goes out without this field
+        print(f"{field} unavailable: ", repr(e))
+        return None
+
+
+def batch_get_all(table_name, keys, max_attempts=5):
+    # batch_get_item takes at most 100 keys and may hand some back unprocessed
+    items = []
+    for i in range(0, len(keys), 100):
+        request = {table_name: {'Keys': keys[i:i + 100]}}
+        for attempt in range(max_attempts):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+        if request:
+            raise Exception(f"Could not read {len(request[table_name]['Keys'])} keys from {table_name}")
+    return items
+
+
+def get_model_win_rates(model_names):
+    # Single batch read of the per-model aggregates
+    stats = batch_get_all(model_stats_table_name, [{'modelName': name} for name in model_names])
+
+    win_rates = {}
+    for item in stats:
+        outcomes = [item.get(f'recent{slot}') for slot in range(model_stats_ring_size)]
+        win_count = outcomes.count('WIN')
+        total = win_count + outcomes.count('LOSE')
+        win_rates[item['modelName']] = win_count / total if total else 0
+
+    # No aggregate yet, fall back to the index queries, all at once
+    missing = [model_name for model_name in model_names if model_name not in win_rates]
+    win_rates.update(zip(missing, win_rate_fallback_executor.map(getAverageAccuracy, missing)))
+    return win_rates
+
 def getAverageAccuracy(model_name):
     # Query GSI (assuming it's named 'model_name-timestamp-index')
     